@@ -1,44 +1,75 @@
 import os
+import gzip
+import time
 import logging
-from flask import Flask
+import threading
+from urllib.parse import urlparse
+from flask import Flask, request
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.exc import OperationalError
 from sqlalchemy import text
 from werkzeug.middleware.proxy_fix import ProxyFix
-from dotenv import load_dotenv  # <--- agregar esta importación
-
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
-logger = logging.getLogger(__name__)
+import jsonutil
 
 # Cargar variables desde .env antes de leer os.environ
-load_dotenv()  # <--- agregar esta línea
+# In production the .env is baked into env_cache.py (scripts/bake_env.py),
+# which skips parsing the file on every worker start.
+if os.environ.get("ENV_BAKED"):
+    import env_cache  # noqa: F401
+else:
+    from dotenv import load_dotenv
+    load_dotenv()
+
+# Configure logging (set LOG_LEVEL=DEBUG for verbose output)
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
+logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
 
 class Base(DeclarativeBase):
     pass
 
+
+class JSONProvider(DefaultJSONProvider):
+    """jsonify() and request.get_json() through jsonutil (orjson when installed)"""
+
+    def dumps(self, obj, **kwargs):
+        # orjson writes datetimes natively (ISO 8601); Flask's default hook
+        # still covers Decimal, UUID, dataclasses and the stdlib fallback
+        return jsonutil.dumps(obj, default=self.default)
+
+    def loads(self, s, **kwargs):
+        return jsonutil.loads(s)
+
+
 db = SQLAlchemy(model_class=Base)
 
 # Create the app
 app = Flask(__name__)
+app.json = JSONProvider(app)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key")
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
 # Configure the database with error handling
 database_url = os.environ.get("DATABASE_URL")
 if database_url:
-    logger.info(f"Using PostgreSQL database: {database_url[:50]}...")
+    parsed_url = urlparse(database_url)
+    logger.info(f"Using PostgreSQL database: host={parsed_url.hostname} db={parsed_url.path.lstrip('/')}")
     app.config["SQLALCHEMY_DATABASE_URI"] = database_url
     app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
         "pool_recycle": 300,
         "pool_pre_ping": True,
         "pool_timeout": 20,
-        "max_overflow": 0,
+        "pool_size": int(os.environ.get("SQLALCHEMY_POOL_SIZE", "10")),
+        "max_overflow": int(os.environ.get("SQLALCHEMY_MAX_OVERFLOW", "20")),
         "connect_args": {
             "connect_timeout": 10,
             "application_name": "ric_app"
-        }
+        },
+        "json_serializer": jsonutil.dumps,
+        "json_deserializer": jsonutil.loads
     }
 else:
     logger.warning("No DATABASE_URL found, falling back to SQLite")
@@ -46,6 +77,8 @@ else:
     app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
         "pool_recycle": 300,
         "pool_pre_ping": True,
+        "json_serializer": jsonutil.dumps,
+        "json_deserializer": jsonutil.loads
     }
 
 # Configure upload settings
@@ -62,16 +95,80 @@ try:
 except Exception as e:
     logger.error(f"Failed to create upload directory: {str(e)}")
 
-# Add health check function
+# Health checks: /livez (and the older /health) never touch the database,
+# /readyz memoizes the DB ping
+DB_CHECK_TTL = 5  # seconds
+DB_CHECK_TIMEOUT_MS = 500
+_last_db_check = (float('-inf'), True)
+
+
+def check_database():
+    """Run a SELECT 1 at most once every DB_CHECK_TTL seconds"""
+    global _last_db_check
+    checked_at, ok = _last_db_check
+    now = time.monotonic()
+    if now - checked_at < DB_CHECK_TTL:
+        return ok
+
+    try:
+        with db.engine.connect() as conn:
+            if db.engine.dialect.name == 'postgresql':
+                # Bound the ping so a struggling database can't hang the probe
+                conn.execute(text(f'SET LOCAL statement_timeout = {DB_CHECK_TIMEOUT_MS}'))
+            conn.execute(text('SELECT 1'))
+        ok = True
+    except Exception as e:
+        logger.error(f"Readiness database check failed: {str(e)}")
+        ok = False
+    _last_db_check = (now, ok)
+    return ok
+
+
+@app.route('/livez')
 @app.route('/health')
-def health_check():
-    """Health check endpoint for deployment monitoring"""
+def liveness_check():
+    """Liveness probe: the process is up and serving requests"""
+    return {'status': 'ok'}, 200
+
+
+@app.route('/readyz')
+def readiness_check():
+    """Readiness probe for deployment monitoring"""
+    db_ok = check_database()
     status = {
-        'status': 'healthy',
-        'database': 'connected' if db_initialized else 'disconnected',
+        'status': 'healthy' if db_ok else 'unhealthy',
+        'database': 'connected' if db_ok else 'disconnected',
         'upload_dir': os.path.exists(app.config['UPLOAD_FOLDER'])
     }
-    return status, 200 if 'db_initialized' in globals() and db_initialized else 503
+    return status, 200 if db_ok else 503
+
+# gzip JSON and HTML responses for clients that accept it. Streamed responses
+# (Server-Sent Events, file downloads) are passed through untouched.
+COMPRESS_MIMETYPES = frozenset({'application/json', 'text/html'})
+COMPRESS_LEVEL = 5
+COMPRESS_MIN_SIZE = 500  # bytes; smaller bodies aren't worth the gzip header
+
+
+@app.after_request
+def compress_response(response):
+    """Gzip compressible response bodies when the client sends Accept-Encoding: gzip"""
+    if (response.mimetype not in COMPRESS_MIMETYPES
+            or response.direct_passthrough
+            or response.is_streamed
+            or not 200 <= response.status_code < 300
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    if 'gzip' not in request.accept_encodings:
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    response.set_data(gzip.compress(data, COMPRESS_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
 
 def initialize_database():
     """Initialize database with proper error handling"""
@@ -82,13 +179,12 @@ def initialize_database():
                 conn.execute(text('SELECT 1'))
             logger.info("Database connection successful")
             
-            # Import models and routes
-            import models  # noqa: F401
-            import routes  # noqa: F401
-            
-            # Create all database tables
-            db.create_all()
-            logger.info("Database tables created successfully")
+            # Schema work is left to a dedicated migration run (RUN_MIGRATIONS=1)
+            # so serving workers don't introspect every table on boot. The
+            # local SQLite fallback always creates its tables.
+            if os.environ.get("RUN_MIGRATIONS") == "1" or not database_url:
+                db.create_all()
+                logger.info("Database tables created successfully")
             return True
             
     except OperationalError as e:
@@ -99,13 +195,43 @@ def initialize_database():
         logger.error(f"Unexpected database error: {str(e)}")
         return False
 
-# Initialize database
-db_initialized = initialize_database()
+# The database is initialized lazily on the first request instead of at import,
+# so importing the app never blocks on the database and a DB outage at boot
+# doesn't keep the process from serving /livez. Failed attempts are retried
+# with exponential backoff.
+DB_INIT_MAX_BACKOFF = 60  # seconds
+db_initialized = False
+_db_init_lock = threading.Lock()
+_db_retry_at = 0.0
+_db_backoff = 1.0
 
-# Import routes even if database fails (for health checks, etc.)
-if not db_initialized:
-    try:
-        import routes  # noqa: F401
-        logger.info("Routes imported despite database connection failure")
-    except Exception as e:
-        logger.error(f"Failed to import routes: {str(e)}")
+
+def ensure_database():
+    """Initialize the database once, backing off between failed attempts"""
+    global db_initialized, _db_retry_at, _db_backoff
+    if db_initialized or time.monotonic() < _db_retry_at:
+        return db_initialized
+
+    with _db_init_lock:
+        if not db_initialized and time.monotonic() >= _db_retry_at:
+            db_initialized = initialize_database()
+            if not db_initialized:
+                _db_retry_at = time.monotonic() + _db_backoff
+                _db_backoff = min(_db_backoff * 2, DB_INIT_MAX_BACKOFF)
+    return db_initialized
+
+
+@app.before_request
+def initialize_database_lazily():
+    """Connect on the first real request; health probes never wait on the DB"""
+    if request.endpoint not in ('liveness_check', 'readiness_check', 'static'):
+        ensure_database()
+
+
+# Import models and routes; neither touches the database on import
+import models  # noqa: F401,E402
+import routes  # noqa: F401,E402
+
+# Migration runs (RUN_MIGRATIONS=1) create the schema eagerly at startup
+if os.environ.get("RUN_MIGRATIONS") == "1":
+    ensure_database()
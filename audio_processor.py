@@ -1,14 +1,18 @@
 import os
 import re
 import logging
-from openai import OpenAI
+from functools import cached_property
+from openai_client import get_client
+
+# Whisper answers only once the whole file is transcribed, far past the shared
+# client's 60s timeout for long recordings; this is the SDK's own default
+TRANSCRIPTION_TIMEOUT = 600.0
+
 
 class AudioProcessor:
     """Audio processing for transcription and basic analysis"""
     
     def __init__(self):
-        self.openai_client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-        
         # Spanish filler words for educational context
         self.spanish_fillers = [
             'eh', 'este', 'esto', 'um', 'uh', 'mm', 'hmm', 'bueno', 'o sea',
@@ -16,6 +20,11 @@ class AudioProcessor:
             'emmm', 'eeeh', 'aaa', 'eee'
         ]
     
+    @cached_property
+    def openai_client(self):
+        """Shared OpenAI client (same connection pool), with the transcription timeout"""
+        return get_client().with_options(timeout=TRANSCRIPTION_TIMEOUT)
+    
     def transcribe_audio(self, audio_file_path):
         """
         Transcribe audio using Whisper API with educational focus
@@ -214,4 +223,8 @@ class AudioProcessor:
             
         except Exception as e:
             logging.error(f"Basic pause analysis error: {str(e)}")
-            return {'count': 0, 'avg_ms': 0, 'total_ms': 0}
\ No newline at end of file
+            return {'count': 0, 'avg_ms': 0, 'total_ms': 0}
+
+
+# Stateless, so one instance serves every request
+processor = AudioProcessor()
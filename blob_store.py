@@ -0,0 +1,48 @@
+"""Content-addressed store for large texts kept out of the database"""
+import os
+import gzip
+import hashlib
+import tempfile
+from typing import Optional
+
+# Blobs live next to the uploads, gzipped, as blobs/<sha[:2]>/<sha>.txt.gz.
+# The name is the SHA-256 of the text, so identical texts are stored once and
+# a stored blob never changes.
+BLOB_FOLDER = os.environ.get("BLOB_FOLDER", os.path.join("uploads", "blobs"))
+BLOB_COMPRESS_LEVEL = 6
+
+
+def _blob_path(sha256: str) -> str:
+    return os.path.join(BLOB_FOLDER, sha256[:2], f"{sha256}.txt.gz")
+
+
+def put_text(text: str) -> str:
+    """Store text and return its SHA-256 hex digest"""
+    data = text.encode()
+    sha256 = hashlib.sha256(data).hexdigest()
+    path = _blob_path(sha256)
+    if os.path.exists(path):
+        return sha256
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # Write to a temporary file and rename it into place, so concurrent writers
+    # and readers never see a partial blob
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(gzip.compress(data, BLOB_COMPRESS_LEVEL))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return sha256
+
+
+def get_text(sha256: str) -> Optional[str]:
+    """Return the text stored under sha256, or None if the blob is missing"""
+    try:
+        with open(_blob_path(sha256), "rb") as f:
+            return gzip.decompress(f.read()).decode()
+    except FileNotFoundError:
+        return None
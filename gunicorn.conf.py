@@ -0,0 +1,19 @@
+import os
+import multiprocessing
+
+# Gunicorn picks this file up automatically from the working directory.
+# Most of a request's time is spent waiting on OpenAI (Whisper / GPT), so each
+# worker runs a thread pool: while one thread waits on the network, the others
+# keep serving requests without forking more processes.
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+worker_class = "gthread"
+workers = int(os.environ.get("GUNICORN_WORKERS", min(multiprocessing.cpu_count() * 2 + 1, 4)))
+# Each open analysis page also holds a thread for its status stream (at most
+# 30s before the browser reconnects), so a worker serves roughly
+# `threads` concurrent requests + watching tabs; raise GUNICORN_THREADS for
+# more simultaneous viewers
+threads = int(os.environ.get("GUNICORN_THREADS", "32"))
+
+# OpenAI calls for long lesson plans can take well over the 30s default
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "180"))
+keepalive = 5
@@ -0,0 +1,22 @@
+"""JSON helpers backed by orjson when installed, falling back to the stdlib"""
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+if orjson is not None:
+    # orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers can
+    # keep catching the stdlib exception either way
+    loads = orjson.loads
+
+    def dumps(obj, default=None):
+        """Serialize obj to a JSON str, calling default for unsupported types"""
+        return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS).decode()
+else:
+    loads = json.loads
+
+    def dumps(obj, default=None):
+        """Serialize obj to a JSON str, calling default for unsupported types"""
+        return json.dumps(obj, default=default)
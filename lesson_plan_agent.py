@@ -1,142 +1,18 @@
 import os
-import json
+import re
+import copy
+import time
+import asyncio
+import hashlib
 import logging
+from typing import Any, AsyncIterator, Dict, Final, Iterator, List, Literal, Optional, Tuple, get_args
 from openai import OpenAI
+from pydantic import BaseModel, ConfigDict, ValidationError, create_model
+import jsonutil
+from cache import TTLCache, SingleFlight
+from openai_client import get_client, get_async_client, run_async
 
-class LessonPlanAgent:
-    """AI Agent specialized in pedagogical analysis of lesson plans using GPT-4o"""
-    
-    def __init__(self):
-        # Using GPT-4-turbo as requested
-        self.client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-        self.model = "gpt-4-turbo"
-    
-    def generate_pedagogical_feedback(self, analysis_data):
-        """
-        Generate comprehensive pedagogical feedback for lesson plans
-        
-        Args:
-            analysis_data: Dict containing PDF structure analysis and educational context
-            
-        Returns:
-            Dict with structured pedagogical feedback
-        """
-        try:
-            # Prepare the analysis summary for the AI
-            structure_analysis = analysis_data.get('structure_analysis', {})
-            educational_context = analysis_data.get('educational_context', {})
-            pdf_summary = analysis_data.get('pdf_summary', '')
-            
-            analysis_summary = self._prepare_lesson_plan_summary(structure_analysis, educational_context, pdf_summary)
-            
-            # Generate comprehensive pedagogical feedback
-            feedback_response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": self._get_pedagogical_system_prompt()
-                    },
-                    {
-                        "role": "user",
-                        "content": f"Analiza esta planeación de clase y proporciona retroalimentación pedagógica:\n\n{analysis_summary}"
-                    }
-                ],
-                response_format={"type": "json_object"},
-                temperature=0.7
-            )
-            
-            content = feedback_response.choices[0].message.content
-            if content is None:
-                raise Exception("Empty response from AI model")
-            feedback = json.loads(content)
-            
-            # Add metadata
-            feedback['analysis_timestamp'] = analysis_data.get('timestamp')
-            feedback['lesson_plan_agent_version'] = '1.0'
-            feedback['analysis_type'] = 'lesson_plan'
-            
-            return feedback
-            
-        except Exception as e:
-            logging.error(f"Lesson Plan Agent error: {str(e)}")
-            return self._get_error_feedback(str(e))
-    
-    def _prepare_lesson_plan_summary(self, structure_analysis, educational_context, pdf_summary):
-        """Prepare a comprehensive summary for AI analysis"""
-        summary = []
-        
-        # Educational context
-        if educational_context:
-            summary.append("=== CONTEXTO EDUCATIVO ===")
-            summary.append(f"Materia: {educational_context.get('subject', 'No especificado')}")
-            summary.append(f"Grado: {educational_context.get('grade_level', 'No especificado')}")
-            summary.append(f"Tema de la clase: {educational_context.get('lesson_topic', 'No especificado')}")
-            
-            if educational_context.get('lesson_duration'):
-                summary.append(f"Duración planificada: {educational_context.get('lesson_duration')} minutos")
-            
-            if educational_context.get('student_count'):
-                summary.append(f"Número de estudiantes: {educational_context.get('student_count')}")
-            
-            if educational_context.get('additional_context'):
-                summary.append(f"Contexto adicional: {educational_context.get('additional_context')}")
-            summary.append("")
-        
-        # Structure analysis summary
-        if structure_analysis:
-            summary.append("=== ANÁLISIS ESTRUCTURAL ===")
-            summary.append(f"Completitud de la planeación: {structure_analysis.get('completeness_score', 0)}/100")
-            summary.append(f"Páginas analizadas: {structure_analysis.get('total_pages', 0)}")
-            summary.append(f"Total de palabras: {structure_analysis.get('total_words', 0)}")
-            
-            sections_found = structure_analysis.get('sections_found', [])
-            if sections_found:
-                summary.append(f"Secciones encontradas: {', '.join(sections_found)}")
-            
-            # Learning objectives
-            objectives = structure_analysis.get('learning_objectives', [])
-            if objectives:
-                summary.append(f"\nObjetivos de aprendizaje ({len(objectives)} encontrados):")
-                for i, obj in enumerate(objectives[:5], 1):
-                    summary.append(f"  {i}. {obj}")
-            
-            # Activities
-            activities_count = structure_analysis.get('activities_count', 0)
-            if activities_count > 0:
-                summary.append(f"\nActividades planificadas: {activities_count}")
-            
-            # Assessment methods
-            assessment_methods = structure_analysis.get('assessment_methods', [])
-            if assessment_methods:
-                summary.append(f"Métodos de evaluación: {', '.join(assessment_methods)}")
-            
-            # Resources
-            resources = structure_analysis.get('resources_list', [])
-            if resources:
-                summary.append(f"Recursos educativos: {', '.join(resources[:5])}")
-            
-            # Time allocation
-            time_info = structure_analysis.get('time_allocation', {})
-            if time_info.get('total_minutes', 0) > 0:
-                summary.append(f"Tiempo total estimado: {time_info['total_minutes']} minutos")
-                summary.append(f"Actividades con tiempo asignado: {time_info.get('activities_with_time', 0)}")
-            
-            # Grade level indicators
-            grade_indicators = structure_analysis.get('grade_level_indicators', [])
-            if grade_indicators:
-                summary.append(f"Indicadores de nivel detectados: {', '.join(grade_indicators)}")
-        
-        # PDF content summary
-        if pdf_summary:
-            summary.append("\n=== CONTENIDO DE LA PLANEACIÓN ===")
-            summary.append(pdf_summary)
-        
-        return "\n".join(summary)
-    
-    def _get_pedagogical_system_prompt(self):
-        """Get the system prompt for pedagogical lesson plan analysis"""
-        return """
+_PEDAGOGICAL_SYSTEM_PROMPT: Final[str] = """
 Eres un Evaluador Pedagógico Oficial especializado en analizar planeaciones de clase según los criterios establecidos por el Ministerio de Educación. Tu rol es evaluar sistemáticamente cada planeación usando la FICHA DE OBSERVACIÓN PLANIFICACIÓN DE LA SESIÓN oficial.
 
 CRITERIOS DE EVALUACIÓN MINISTERIAL (12 CRITERIOS OFICIALES):
@@ -277,45 +153,973 @@ IMPORTANTE:
 - Proporciona ejemplos específicos de cómo mejorar cada criterio
 - Considera el marco curricular nacional en cada evaluación
 """
+
+# Sent verbatim on every call: OpenAI's automatic prompt caching needs the
+# leading tokens of each request to be byte-identical
+_SYSTEM_MESSAGE: Final[Dict[str, str]] = {"role": "system", "content": _PEDAGOGICAL_SYSTEM_PROMPT}
+
+# Packing several plans into one request: the ministerial prompt is kept as
+# an unchanged prefix (so it still hits the prompt cache) and the addendum
+# wraps the per-plan schema in a "results" array
+_PACKED_SYSTEM_PROMPT: Final[str] = _PEDAGOGICAL_SYSTEM_PROMPT + """
+EVALUACIÓN DE VARIAS PLANEACIONES:
+Recibirás varias planeaciones, cada una precedida por su marcador [ID=n]. Evalúa cada una de forma independiente y devuelve un único objeto JSON con este formato:
+{
+  "results": [
+    {"id": n, ...todos los campos del FORMATO DE SALIDA para la planeación n...}
+  ]
+}
+Incluye exactamente un elemento en "results" por cada planeación recibida.
+"""
+_PACKED_SYSTEM_MESSAGE: Final[Dict[str, str]] = {"role": "system", "content": _PACKED_SYSTEM_PROMPT}
+
+# Part of every feedback cache key, so editing the prompt invalidates stored feedback
+_PROMPT_DIGEST: Final[str] = hashlib.blake2b(_PEDAGOGICAL_SYSTEM_PROMPT.encode(), digest_size=8).hexdigest()
+
+# The 12 ministerial criteria, in the order of the ficha de observación
+_CRITERIA: Final = (
+    "desarrollo_competencias",
+    "triangulacion",
+    "criterios_evaluacion",
+    "procesos_didacticos",
+    "metacognicion",
+    "secuencia_actividades",
+    "tiempos_viables",
+    "evaluacion_formativa",
+    "principios_ebc_agencia",
+    "principios_ebc_evaluacion",
+    "principios_ebc_instruccion",
+    "recursos_contextualizados",
+)
+
+# "TITLE\nDescription" of each criterion, read from the prompt itself so the
+# per-criterion evaluation can't drift from the full one
+_CRITERION_GUIDES: Final[Dict[str, str]] = dict(zip(
+    _CRITERIA,
+    re.findall(r"^\d+\. (.+\n.+)$", _PEDAGOGICAL_SYSTEM_PROMPT.split("FORMATO DE SALIDA")[0], re.M)
+))
+_CRITERION_TITLES: Final[Dict[str, str]] = {
+    criterion: guide.split("\n", 1)[0] for criterion, guide in _CRITERION_GUIDES.items()
+}
+
+# Error feedback skeleton, built once and deep-copied per failure
+_ERROR_TEMPLATE: Final[Dict[str, Any]] = {
+    "overall_score": 0,
+    "summary": "No se pudo completar el análisis pedagógico según criterios ministeriales debido a un error técnico.",
+    "strengths": [],
+    "areas_for_improvement": ["Error técnico impidió el análisis según ficha ministerial"],
+    "detailed_analysis": {
+        criterion: {"score": 0, "feedback": "Error en el análisis", "recommendations": []}
+        for criterion in _CRITERIA
+    },
+    "criterios_ministeriales": {criterion: "no_cumple" for criterion in _CRITERIA},
+    "action_plan": ["Por favor, intenta subir el archivo PDF nuevamente"],
+    "observaciones_oficiales": ["Error técnico impidió evaluación ministerial"],
+    "recomendaciones_normativas": ["Reintenta el análisis con archivo válido"],
+    "lesson_plan_agent_version": "2.0_ministerial"
+}
+
+# Response contract of _PEDAGOGICAL_SYSTEM_PROMPT. Pydantic (already installed with the
+# openai SDK) compiles these validators once at import; decoding the model
+# output through them surfaces schema drift at the source instead of as
+# KeyErrors in the templates.
+# Compliance level of a ministerial criterion, shared by the models and schemas
+Nivel = Literal["no_cumple", "parcial", "cumple", "supera"]
+
+
+class CriterionAnalysis(BaseModel):
+    score: int
+    feedback: str
+    recommendations: List[str]
+
+
+class CriterionResult(CriterionAnalysis):
+    nivel: Nivel
+
+
+# One field per ministerial criterion, generated so they can't drift from _CRITERIA
+DetailedAnalysis = create_model(
+    "DetailedAnalysis", **{criterion: (CriterionAnalysis, ...) for criterion in _CRITERIA}
+)
+CriteriosMinisteriales = create_model(
+    "CriteriosMinisteriales", **{criterion: (Nivel, ...) for criterion in _CRITERIA}
+)
+
+
+class PedagogicalFeedback(BaseModel):
+    # Keep any extra keys the model adds rather than dropping them
+    model_config = ConfigDict(extra="allow")
+    
+    overall_score: int
+    summary: str
+    strengths: List[str]
+    areas_for_improvement: List[str]
+    detailed_analysis: DetailedAnalysis
+    criterios_ministeriales: CriteriosMinisteriales
+    action_plan: List[str]
+    observaciones_oficiales: List[str]
+    recomendaciones_normativas: List[str]
+
+
+def _strict_object(properties: Dict[str, Any]) -> Dict[str, Any]:
+    """JSON schema object in the form Structured Outputs' strict mode requires"""
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False
+    }
+
+
+_STRING_LIST = {"type": "array", "items": {"type": "string"}}
+_NIVEL_SCHEMA = {"type": "string", "enum": list(get_args(Nivel))}
+_CRITERION_SCHEMA = _strict_object({
+    "score": {"type": "integer"},
+    "feedback": {"type": "string"},
+    "recommendations": _STRING_LIST
+})
+
+# The FORMATO DE SALIDA of _PEDAGOGICAL_SYSTEM_PROMPT as a strict JSON schema.
+# With Structured Outputs the model is constrained to produce exactly this
+# shape, so the reply always parses and never needs a repair retry.
+_FEEDBACK_SCHEMA: Final = _strict_object({
+    "overall_score": {"type": "integer"},
+    "summary": {"type": "string"},
+    "strengths": _STRING_LIST,
+    "areas_for_improvement": _STRING_LIST,
+    "detailed_analysis": _strict_object({criterion: _CRITERION_SCHEMA for criterion in _CRITERIA}),
+    "criterios_ministeriales": _strict_object({criterion: _NIVEL_SCHEMA for criterion in _CRITERIA}),
+    "action_plan": _STRING_LIST,
+    "observaciones_oficiales": _STRING_LIST,
+    "recomendaciones_normativas": _STRING_LIST
+})
+_STRUCTURED_FORMAT: Final = {
+    "type": "json_schema",
+    "json_schema": {"name": "lesson_plan_evaluation", "schema": _FEEDBACK_SCHEMA, "strict": True}
+}
+_JSON_OBJECT_FORMAT: Final = {"type": "json_object"}
+FEEDBACK_TEMPERATURE = 0.7
+
+# Models that accept json_schema response formats, by name without the
+# -YYYY-MM-DD snapshot suffix; other models (e.g. gpt-4-turbo, o1-mini) fall
+# back to plain JSON mode. gpt-4o's first snapshot predates Structured Outputs.
+_STRUCTURED_OUTPUT_MODELS: Final = frozenset({
+    "gpt-4o", "gpt-4o-mini", "gpt-4.1", "gpt-4.1-mini", "gpt-4.1-nano",
+    "gpt-5", "gpt-5-mini", "gpt-5-nano", "o1", "o3", "o3-mini", "o4-mini"
+})
+_UNSTRUCTURED_SNAPSHOTS: Final = frozenset({"gpt-4o-2024-05-13"})
+_SNAPSHOT_SUFFIX = re.compile(r"-\d{4}-\d{2}-\d{2}$")
+# Reasoning models reject sampling parameters such as temperature
+_REASONING_MODEL_PREFIXES: Final = ("o1", "o3", "o4", "gpt-5")
+
+
+def _base_model(model: str) -> str:
+    """Model name without its snapshot date (gpt-4o-2024-08-06 -> gpt-4o)"""
+    return _SNAPSHOT_SUFFIX.sub("", model)
+
+
+def _response_format(model: str, structured_format: Dict[str, Any]) -> Dict[str, Any]:
+    """structured_format if the model supports Structured Outputs, else JSON mode"""
+    if _base_model(model) in _STRUCTURED_OUTPUT_MODELS and model not in _UNSTRUCTURED_SNAPSHOTS:
+        return structured_format
+    return _JSON_OBJECT_FORMAT
+
+
+def _is_reasoning_model(model: str) -> bool:
+    return model.startswith(_REASONING_MODEL_PREFIXES)
+
+
+def _sampling_params(model: str, temperature: float) -> Dict[str, Any]:
+    """Sampling arguments for model; reasoning models only run at their default"""
+    return {} if _is_reasoning_model(model) else {"temperature": temperature}
+
+
+# Reasoning models count their hidden reasoning against max_completion_tokens,
+# so they get this much on top of the visible reply's budget
+REASONING_TOKEN_ALLOWANCE = 4000
+
+
+def _token_limit(model: str, max_tokens: int) -> Dict[str, Any]:
+    """Reply length cap for model (max_tokens is deprecated and rejected by reasoning models)"""
+    if _is_reasoning_model(model):
+        max_tokens += REASONING_TOKEN_ALLOWANCE
+    return {"max_completion_tokens": max_tokens}
+
+
+# Per-criterion evaluation (LESSON_PLAN_PARALLEL_CRITERIA=1): each criterion
+# is scored by its own small request, all twelve running concurrently
+_CRITERION_SYSTEM_TEMPLATE = """
+Eres un Evaluador Pedagógico Oficial especializado en analizar planeaciones de clase según los criterios establecidos por el Ministerio de Educación. Evalúa la planeación ÚNICAMENTE según el siguiente criterio de la FICHA DE OBSERVACIÓN PLANIFICACIÓN DE LA SESIÓN oficial:
+
+{guide}
+
+FORMATO DE SALIDA (JSON):
+{{
+  "score": 1-100,
+  "feedback": "Análisis breve del criterio con evidencias específicas de la planeación, en español",
+  "recommendations": ["1-2 sugerencias concretas para cumplir el criterio"],
+  "nivel": "no_cumple|parcial|cumple|supera"
+}}
+
+TONO: Evaluativo oficial, profesional, constructivo. Todas las respuestas en español.
+"""
+_CRITERION_SYSTEM_MESSAGES: Final[Dict[str, Dict[str, str]]] = {
+    criterion: {"role": "system", "content": _CRITERION_SYSTEM_TEMPLATE.format(guide=guide)}
+    for criterion, guide in _CRITERION_GUIDES.items()
+}
+_CRITERION_FORMAT: Final = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "lesson_plan_criterion",
+        "schema": _strict_object({
+            "score": {"type": "integer"},
+            "feedback": {"type": "string"},
+            "recommendations": _STRING_LIST,
+            "nivel": _NIVEL_SCHEMA
+        }),
+        "strict": True
+    }
+}
+MAX_CRITERION_TOKENS = 400
+CRITERION_TEMPERATURE = 0.7
+CRITERION_ATTEMPTS = 2  # a malformed or truncated reply is retried once
+
+# Part of each criterion's cache key, so editing its prompt, the output schema
+# or the sampling settings invalidates stored results
+_CRITERION_DIGESTS: Final[Dict[str, str]] = {
+    criterion: hashlib.blake2b(
+        f"{message['content']}\0{_CRITERION_FORMAT!r}\0{MAX_CRITERION_TOKENS}\0{CRITERION_TEMPERATURE}".encode(),
+        digest_size=8
+    ).hexdigest()
+    for criterion, message in _CRITERION_SYSTEM_MESSAGES.items()
+}
+
+
+def _aggregate_criteria(results: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Assemble per-criterion results into the full feedback structure"""
+    ranked = sorted(_CRITERIA, key=lambda criterion: results[criterion]["score"])
+    weakest, strongest = ranked[:3], ranked[::-1][:3]
+    overall_score = round(sum(result["score"] for result in results.values()) / len(results))
+    met = sum(1 for result in results.values() if result["nivel"] in ("cumple", "supera"))
     
-    def _get_error_feedback(self, error_message):
-        """Return error feedback structure for lesson plans using ministerial criteria"""
+    def noted(criterion: str) -> str:
+        return f"{_CRITERION_TITLES[criterion]}: {results[criterion]['feedback']}"
+    
+    return {
+        "overall_score": overall_score,
+        "summary": (
+            f"La planeación cumple o supera {met} de {len(_CRITERIA)} criterios ministeriales, "
+            f"con un puntaje global de {overall_score}/100."
+        ),
+        "strengths": [noted(criterion) for criterion in strongest],
+        "areas_for_improvement": [noted(criterion) for criterion in weakest],
+        "detailed_analysis": {
+            criterion: {
+                "score": results[criterion]["score"],
+                "feedback": results[criterion]["feedback"],
+                "recommendations": results[criterion]["recommendations"]
+            }
+            for criterion in _CRITERIA
+        },
+        "criterios_ministeriales": {criterion: results[criterion]["nivel"] for criterion in _CRITERIA},
+        "action_plan": [rec for criterion in ranked[:5] for rec in results[criterion]["recommendations"][:1]],
+        "observaciones_oficiales": [
+            f"Criterio {_CRITERION_TITLES[criterion]}: {results[criterion]['nivel'].replace('_', ' ')}"
+            for criterion in weakest
+        ],
+        "recomendaciones_normativas": [
+            rec for criterion in weakest for rec in results[criterion]["recommendations"][1:2]
+        ]
+    }
+
+
+# Evaluator model; override with LESSON_PLAN_MODEL
+DEFAULT_MODEL = "gpt-4o"
+
+# With LESSON_PLAN_DRAFT_MODEL set (e.g. gpt-4o-mini), that cheaper model drafts
+# each evaluation first, and drafts scoring any criterion outside this range
+# are re-evaluated by the main model
+ESCALATION_SCORE_RANGE = (40, 90)
+
+# Simultaneous OpenAI requests per batch, to respect the account's RPM limits
+MAX_BATCH_CONCURRENCY = 8
+
+# Lesson plans per packed request. The evaluations share one reply and its
+# output-token limit, so the pack has to stay small
+MAX_PACKED_PLANS = 3
+
+# Upper bounds on the lesson plan text sent to the model, so a verbose PDF
+# can't blow up input-token cost or overflow the context window
+MAX_PDF_SUMMARY_CHARS = 8000
+MAX_OBJECTIVE_CHARS = 300
+MAX_RESOURCE_CHARS = 100
+_TRUNCATED_MARKER = "…[truncado]"
+
+# Fixed header blocks of the lesson plan summary
+_CONTEXT_TEMPLATE = (
+    "=== CONTEXTO EDUCATIVO ===\n"
+    "Materia: {subject}\n"
+    "Grado: {grade_level}\n"
+    "Tema de la clase: {lesson_topic}"
+)
+_STRUCTURE_TEMPLATE = (
+    "=== ANÁLISIS ESTRUCTURAL ===\n"
+    "Completitud de la planeación: {completeness_score}/100\n"
+    "Páginas analizadas: {total_pages}\n"
+    "Total de palabras: {total_words}"
+)
+
+# Optional context lines, emitted in order when the value is present
+_CONTEXT_FIELDS: Final = (
+    ("lesson_duration", "Duración planificada: {} minutos"),
+    ("student_count", "Número de estudiantes: {}"),
+    ("additional_context", "Contexto adicional: {}"),
+)
+
+
+class _Defaults(dict):
+    """format_map() mapping that substitutes a default for missing keys"""
+    
+    def __init__(self, data: Dict[str, Any], default: Any) -> None:
+        super().__init__(data)
+        self.default = default
+    
+    def __missing__(self, key: str) -> Any:
+        return self.default
+
+
+class _CriterionScanner:
+    """
+    Incrementally scans a streamed JSON reply for finished criteria
+    
+    Tracks just enough JSON structure (strings, nesting and object keys) to
+    notice when a detailed_analysis.<criterion> object closes, then parses
+    only that span. Malformed input is left for the final full validation.
+    """
+    
+    def __init__(self) -> None:
+        self._text = ""
+        self._pos = 0
+        self._path: List[Optional[str]] = []  # key of each open container
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string = ""
+        self._key: Optional[str] = None
+        self._criterion_start = 0
+    
+    def feed(self, delta: str) -> List[Tuple[str, Dict[str, Any]]]:
+        """Consume the next fragment and return the criteria completed by it"""
+        self._text += delta
+        text = self._text
+        path = self._path
+        finished = []
+        
+        for i in range(self._pos, len(text)):
+            char = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start:i + 1]
+            elif char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char == ":":
+                try:
+                    self._key = jsonutil.loads(self._last_string)
+                except ValueError:
+                    self._key = None
+            elif char == ",":
+                self._key = None
+            elif char in "{[":
+                path.append(self._key)
+                self._key = None
+                if char == "{" and len(path) == 3 and path[1] == "detailed_analysis":
+                    self._criterion_start = i
+            elif char in "}]":
+                if char == "}" and len(path) == 3 and path[1] == "detailed_analysis":
+                    try:
+                        finished.append((path[2], jsonutil.loads(text[self._criterion_start:i + 1])))
+                    except ValueError:
+                        pass
+                if path:
+                    path.pop()
+        
+        self._pos = len(text)
+        return finished
+
+
+# Parsed feedback keyed by prompt hash; identical re-uploads skip the model
+_FEEDBACK_CACHE = TTLCache(maxsize=1024, ttl=24 * 60 * 60)
+_IN_FLIGHT = SingleFlight()
+
+
+class LessonPlanAgent:
+    """AI Agent specialized in pedagogical analysis of lesson plans using GPT-4o"""
+    
+    __slots__ = ("model", "draft_model", "parallel_criteria")
+    
+    def __init__(self) -> None:
+        self.model = os.environ.get("LESSON_PLAN_MODEL", DEFAULT_MODEL)
+        self.draft_model = os.environ.get("LESSON_PLAN_DRAFT_MODEL") or None
+        self.parallel_criteria = os.environ.get("LESSON_PLAN_PARALLEL_CRITERIA") == "1"
+    
+    @property
+    def client(self) -> OpenAI:
+        """Shared OpenAI client, resolved on first use so importing needs no API key"""
+        return get_client()
+    
+    def generate_pedagogical_feedback(self, analysis_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Generate comprehensive pedagogical feedback for lesson plans
+        
+        Args:
+            analysis_data: Dict containing PDF structure analysis and educational context
+            
+        Returns:
+            Dict with structured pedagogical feedback
+        """
+        if self.parallel_criteria:
+            return self.generate_pedagogical_feedback_parallel(analysis_data)
+        
+        try:
+            messages = self._build_messages(analysis_data)
+            cache_key = self._cache_key(messages)
+            
+            feedback = _FEEDBACK_CACHE.get(cache_key)
+            if feedback is None:
+                # Concurrent requests for the same plan share a single upstream call
+                feedback = _IN_FLIGHT.do(cache_key, lambda: self._fetch_feedback(messages, cache_key))
+            return self.with_metadata(feedback, analysis_data)
+            
+        except Exception as e:
+            logging.error(f"Lesson Plan Agent error: {str(e)}")
+            return self._get_error_feedback(str(e))
+    
+    async def agenerate_pedagogical_feedback(self, analysis_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Async variant of generate_pedagogical_feedback
+        
+        Awaits the OpenAI call on the event loop's AsyncOpenAI client, so many
+        lesson plans can be analyzed concurrently under asyncio.gather.
+        
+        Args:
+            analysis_data: Dict containing PDF structure analysis and educational context
+            
+        Returns:
+            Dict with structured pedagogical feedback
+        """
+        try:
+            messages = self._build_messages(analysis_data)
+            cache_key = self._cache_key(messages)
+            
+            feedback = _FEEDBACK_CACHE.get(cache_key)
+            if feedback is None:
+                chunks = [delta async for delta in self._astream_completion(messages)]
+                feedback = self._parse_feedback("".join(chunks), cache_key)
+            return self.with_metadata(feedback, analysis_data)
+            
+        except Exception as e:
+            logging.error(f"Lesson Plan Agent error: {str(e)}")
+            return self._get_error_feedback(str(e))
+    
+    def generate_pedagogical_feedback_batch(self, analysis_data_list: List[Dict[str, Any]],
+                                            max_concurrency: int = MAX_BATCH_CONCURRENCY) -> List[Dict[str, Any]]:
+        """
+        Generate pedagogical feedback for several lesson plans concurrently
+        
+        Wall-clock time is roughly that of the slowest plan instead of the sum;
+        concurrency is bounded to stay within the OpenAI rate limits.
+        
+        Args:
+            analysis_data_list: List of analysis_data dicts, one per lesson plan
+            max_concurrency: Maximum number of simultaneous OpenAI requests
+            
+        Returns:
+            List of feedback dicts in the same order as the input
+        """
+        if not analysis_data_list:
+            return []
+        return run_async(self.agenerate_pedagogical_feedback_batch(analysis_data_list, max_concurrency))
+    
+    async def agenerate_pedagogical_feedback_batch(self, analysis_data_list: List[Dict[str, Any]],
+                                                   max_concurrency: int = MAX_BATCH_CONCURRENCY) -> List[Dict[str, Any]]:
+        """Async variant of generate_pedagogical_feedback_batch"""
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def bounded(analysis_data: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.agenerate_pedagogical_feedback(analysis_data)
+        
+        return await asyncio.gather(*(bounded(data) for data in analysis_data_list))
+    
+    def generate_pedagogical_feedback_parallel(self, analysis_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Sync wrapper around agenerate_pedagogical_feedback_parallel"""
+        return run_async(self.agenerate_pedagogical_feedback_parallel(analysis_data))
+    
+    async def agenerate_pedagogical_feedback_parallel(self, analysis_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Evaluate each ministerial criterion in its own concurrent request
+        
+        Twelve short replies generated in parallel finish in roughly the time
+        of the slowest one, instead of one long reply produced token by token.
+        Each criterion result is cached on its own, and only a criterion whose
+        reply fails validation is retried. The remaining fields (summary,
+        strengths, action plan...) are derived from the criterion results.
+        
+        Args:
+            analysis_data: Dict containing PDF structure analysis and educational context
+            
+        Returns:
+            Dict with structured pedagogical feedback
+        """
+        try:
+            summary = self._build_messages(analysis_data)[-1]["content"]
+            results = await asyncio.gather(*(
+                self._aevaluate_criterion(criterion, summary) for criterion in _CRITERIA
+            ))
+            feedback = _aggregate_criteria(dict(zip(_CRITERIA, results)))
+            return self.with_metadata(feedback, analysis_data)
+            
+        except Exception as e:
+            logging.error(f"Lesson Plan Agent error: {str(e)}")
+            return self._get_error_feedback(str(e))
+    
+    async def _aevaluate_criterion(self, criterion: str, summary: str) -> Dict[str, Any]:
+        """Score a single criterion, using the draft model when one is configured"""
+        model = self.draft_model or self.model
+        payload = f"{model}\0{criterion}\0{_CRITERION_DIGESTS[criterion]}\0{summary}"
+        cache_key = hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+        result = _FEEDBACK_CACHE.get(cache_key)
+        if result is not None:
+            return result
+        
+        messages = [_CRITERION_SYSTEM_MESSAGES[criterion], {"role": "user", "content": summary}]
+        for attempt in range(1, CRITERION_ATTEMPTS + 1):
+            response = await get_async_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                response_format=_response_format(model, _CRITERION_FORMAT),
+                **_token_limit(model, MAX_CRITERION_TOKENS),
+                **_sampling_params(model, CRITERION_TEMPERATURE)
+            )
+            try:
+                result = CriterionResult.model_validate_json(response.choices[0].message.content or "").model_dump()
+            except ValidationError:
+                if attempt == CRITERION_ATTEMPTS:
+                    raise
+                logging.warning(f"Invalid reply for criterion {criterion}, retrying")
+                continue
+            _FEEDBACK_CACHE.set(cache_key, result)
+            return result
+    
+    def generate_pedagogical_feedback_packed(self, analysis_data_list: List[Dict[str, Any]],
+                                             k: int = MAX_PACKED_PLANS) -> List[Dict[str, Any]]:
+        """
+        Generate pedagogical feedback for several lesson plans, k per request
+        
+        Packing trades output length for request count: the system prompt is
+        sent once per pack instead of once per plan, which leaves headroom
+        under the requests-per-minute limit for short plans.
+        
+        Args:
+            analysis_data_list: List of analysis_data dicts, one per lesson plan
+            k: Maximum number of plans evaluated in a single request
+            
+        Returns:
+            List of feedback dicts in the same order as the input
+        """
+        results: List[Dict[str, Any]] = []
+        for start in range(0, len(analysis_data_list), k):
+            results.extend(self._generate_packed(analysis_data_list[start:start + k]))
+        return results
+    
+    def _generate_packed(self, pack: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Evaluate one pack of lesson plans in a single chat completion"""
+        try:
+            # The packed reply wraps several evaluations, so it can't use the single-plan schema
+            messages = self._build_packed_messages(pack)
+            content = "".join(self._stream_completion(messages, response_format=_JSON_OBJECT_FORMAT))
+            if not content:
+                raise Exception("Empty response from AI model")
+            items = jsonutil.loads(content).get("results") or []
+            by_id = {str(item.get("id")): item for item in items if isinstance(item, dict)}
+        except Exception as e:
+            logging.error(f"Lesson Plan Agent packed request error: {str(e)}")
+            return [self._get_error_feedback(str(e)) for _ in pack]
+        
+        results = []
+        for plan_id, analysis_data in enumerate(pack, 1):
+            item = by_id.get(str(plan_id))
+            if item is None:
+                results.append(self._get_error_feedback(f"Missing result for plan {plan_id} in packed response"))
+                continue
+            try:
+                feedback = PedagogicalFeedback.model_validate(item).model_dump()
+            except Exception as e:
+                results.append(self._get_error_feedback(str(e)))
+                continue
+            feedback.pop("id", None)
+            results.append(self.with_metadata(feedback, analysis_data))
+        return results
+    
+    def stream_pedagogical_feedback(self, analysis_data: Dict[str, Any]) -> Iterator[str]:
+        """
+        Stream the raw JSON feedback from the model as it is generated
+        
+        Closing the generator early (e.g. the client disconnected) closes the
+        underlying HTTP response, which cancels the generation upstream.
+        
+        Args:
+            analysis_data: Dict containing PDF structure analysis and educational context
+            
+        Yields:
+            Text fragments of the JSON response
+        """
+        yield from self._stream_completion(self._build_messages(analysis_data))
+    
+    def stream_feedback_events(self, analysis_data: Dict[str, Any]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Stream pedagogical feedback as (event, data) pairs
+        
+        Yields a ("criterion", {...}) event as soon as the model finishes each
+        detailed_analysis entry, then a single ("feedback", {...}) event with
+        the complete validated feedback (or the error feedback on failure).
+        
+        Args:
+            analysis_data: Dict containing PDF structure analysis and educational context
+            
+        Yields:
+            (event name, data) tuples
+        """
+        try:
+            messages = self._build_messages(analysis_data)
+            cache_key = self._cache_key(messages)
+            
+            feedback = _FEEDBACK_CACHE.get(cache_key)
+            if feedback is None:
+                scanner = _CriterionScanner()
+                chunks = []
+                for delta in self._stream_completion(messages):
+                    chunks.append(delta)
+                    for criterion, data in scanner.feed(delta):
+                        yield "criterion", {"criterion": criterion, "title": _CRITERION_TITLES[criterion], **data}
+                feedback = self._parse_feedback("".join(chunks), cache_key)
+            else:
+                for criterion, data in feedback["detailed_analysis"].items():
+                    yield "criterion", {"criterion": criterion, "title": _CRITERION_TITLES[criterion], **data}
+            
+            yield "feedback", self.with_metadata(feedback, analysis_data)
+            
+        except Exception as e:
+            logging.error(f"Lesson Plan Agent error: {str(e)}")
+            yield "feedback", self._get_error_feedback(str(e))
+    
+    def _fetch_feedback(self, messages: List[Dict[str, str]], cache_key: str) -> Dict[str, Any]:
+        """Request feedback from the model and cache the parsed result"""
+        if self.draft_model:
+            try:
+                draft = self._validate_feedback("".join(self._stream_completion(messages, self.draft_model)))
+                if not self._needs_escalation(draft):
+                    _FEEDBACK_CACHE.set(cache_key, draft)
+                    return draft
+                logging.info(f"Escalating lesson plan evaluation from {self.draft_model} to {self.model}")
+            except Exception as e:
+                logging.warning(f"Draft evaluation with {self.draft_model} failed, escalating: {str(e)}")
+        return self._parse_feedback("".join(self._stream_completion(messages)), cache_key)
+    
+    def _needs_escalation(self, feedback: Dict[str, Any]) -> bool:
+        """Whether a draft has criterion scores extreme enough to double-check"""
+        low, high = ESCALATION_SCORE_RANGE
+        return any(
+            not low <= criterion["score"] <= high
+            for criterion in feedback["detailed_analysis"].values()
+        )
+    
+    def _parse_feedback(self, content: str, cache_key: str) -> Dict[str, Any]:
+        """Validate the model's JSON response and cache the result"""
+        feedback = self._validate_feedback(content)
+        _FEEDBACK_CACHE.set(cache_key, feedback)
+        return feedback
+    
+    def _validate_feedback(self, content: str) -> Dict[str, Any]:
+        """Decode the model's JSON response against the feedback schema"""
+        if not content:
+            raise Exception("Empty response from AI model")
+        # Raises ValidationError (reported as error feedback) on schema drift
+        return PedagogicalFeedback.model_validate_json(content).model_dump()
+    
+    def with_metadata(self, feedback: Dict[str, Any], analysis_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy cached or stored feedback and stamp it with per-request metadata"""
+        feedback = copy.deepcopy(feedback)
+        feedback['analysis_timestamp'] = analysis_data.get('timestamp')
+        feedback['lesson_plan_agent_version'] = '1.0'
+        feedback['analysis_type'] = 'lesson_plan'
+        return feedback
+    
+    def _completion_params(self, messages: List[Dict[str, str]], stream: bool = True,
+                           model: Optional[str] = None,
+                           response_format: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Chat completion arguments shared by the sync, async and batch paths"""
+        model = model or self.model
+        if response_format is None:
+            response_format = _response_format(model, _STRUCTURED_FORMAT)
         return {
-            "overall_score": 0,
-            "summary": "No se pudo completar el análisis pedagógico según criterios ministeriales debido a un error técnico.",
-            "strengths": [],
-            "areas_for_improvement": ["Error técnico impidió el análisis según ficha ministerial"],
-            "detailed_analysis": {
-                "desarrollo_competencias": {"score": 0, "feedback": "Error en el análisis", "recommendations": []},
-                "triangulacion": {"score": 0, "feedback": "Error en el análisis", "recommendations": []},
-                "criterios_evaluacion": {"score": 0, "feedback": "Error en el análisis", "recommendations": []},
-                "procesos_didacticos": {"score": 0, "feedback": "Error en el análisis", "recommendations": []},
-                "metacognicion": {"score": 0, "feedback": "Error en el análisis", "recommendations": []},
-                "secuencia_actividades": {"score": 0, "feedback": "Error en el análisis", "recommendations": []},
-                "tiempos_viables": {"score": 0, "feedback": "Error en el análisis", "recommendations": []},
-                "evaluacion_formativa": {"score": 0, "feedback": "Error en el análisis", "recommendations": []},
-                "principios_ebc_agencia": {"score": 0, "feedback": "Error en el análisis", "recommendations": []},
-                "principios_ebc_evaluacion": {"score": 0, "feedback": "Error en el análisis", "recommendations": []},
-                "principios_ebc_instruccion": {"score": 0, "feedback": "Error en el análisis", "recommendations": []},
-                "recursos_contextualizados": {"score": 0, "feedback": "Error en el análisis", "recommendations": []}
-            },
-            "criterios_ministeriales": {
-                "desarrollo_competencias": "no_cumple",
-                "triangulacion": "no_cumple",
-                "criterios_evaluacion": "no_cumple",
-                "procesos_didacticos": "no_cumple",
-                "metacognicion": "no_cumple",
-                "secuencia_actividades": "no_cumple",
-                "tiempos_viables": "no_cumple",
-                "evaluacion_formativa": "no_cumple",
-                "principios_ebc_agencia": "no_cumple",
-                "principios_ebc_evaluacion": "no_cumple",
-                "principios_ebc_instruccion": "no_cumple",
-                "recursos_contextualizados": "no_cumple"
-            },
-            "action_plan": ["Por favor, intenta subir el archivo PDF nuevamente"],
-            "observaciones_oficiales": ["Error técnico impidió evaluación ministerial"],
-            "recomendaciones_normativas": ["Reintenta el análisis con archivo válido"],
-            "error": error_message,
-            "lesson_plan_agent_version": "2.0_ministerial"
-        }
\ No newline at end of file
+            "model": model,
+            "messages": messages,
+            "response_format": response_format,
+            "stream": stream,
+            **_sampling_params(model, FEEDBACK_TEMPERATURE)
+        }
+    
+    def _stream_completion(self, messages: List[Dict[str, str]], model: Optional[str] = None,
+                           response_format: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+        """Yield content fragments of a streamed chat completion"""
+        params = self._completion_params(messages, model=model, response_format=response_format)
+        stream = self.client.chat.completions.create(**params)
+        try:
+            for chunk in stream:
+                if chunk.choices:
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        yield delta
+        finally:
+            stream.close()
+    
+    async def _astream_completion(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """Async counterpart of _stream_completion"""
+        stream = await get_async_client().chat.completions.create(**self._completion_params(messages))
+        try:
+            async for chunk in stream:
+                if chunk.choices:
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        yield delta
+        finally:
+            await stream.close()
+    
+    def cache_key(self, analysis_data: Dict[str, Any]) -> str:
+        """
+        Key identifying the feedback for analysis_data
+        
+        Identical lesson plans with the same context map to the same key, so
+        callers can persist feedback under it and skip the model on re-uploads.
+        """
+        return self._cache_key(self._build_messages(analysis_data))
+    
+    def _cache_key(self, messages: List[Dict[str, str]]) -> str:
+        """Hash the models and prompt; the request timestamp is not part of the key"""
+        mode = "parallel" if self.parallel_criteria else "single"
+        payload = f"{self.model}\0{self.draft_model or ''}\0{mode}\0{_PROMPT_DIGEST}\0{messages[-1]['content']}"
+        return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+    
+    def _build_messages(self, analysis_data: Dict[str, Any]) -> List[Dict[str, str]]:
+        """Build the chat messages for a lesson plan analysis request"""
+        analysis_summary = self._prepare_lesson_plan_summary(
+            analysis_data.get('structure_analysis', {}),
+            analysis_data.get('educational_context', {}),
+            analysis_data.get('pdf_summary', '')
+        )
+        return [
+            _SYSTEM_MESSAGE,
+            {
+                "role": "user",
+                "content": f"Analiza esta planeación de clase y proporciona retroalimentación pedagógica:\n\n{analysis_summary}"
+            }
+        ]
+    
+    def _build_packed_messages(self, pack: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """Build the chat messages for evaluating several lesson plans at once"""
+        plans = "\n\n".join(
+            f"[ID={plan_id}]\n" + self._prepare_lesson_plan_summary(
+                analysis_data.get('structure_analysis', {}),
+                analysis_data.get('educational_context', {}),
+                analysis_data.get('pdf_summary', '')
+            )
+            for plan_id, analysis_data in enumerate(pack, 1)
+        )
+        return [
+            _PACKED_SYSTEM_MESSAGE,
+            {
+                "role": "user",
+                "content": f"Evalúa las siguientes {len(pack)} planeaciones de clase y devuelve {{\"results\": [...]}} con la retroalimentación pedagógica de cada una:\n\n{plans}"
+            }
+        ]
+    
+    def _prepare_lesson_plan_summary(self, structure_analysis: Dict[str, Any],
+                                     educational_context: Dict[str, Any], pdf_summary: str) -> str:
+        """Prepare a comprehensive summary for AI analysis"""
+        # Input tokens drive both cost and latency, so bound the free-text part.
+        # If the budget gets tight, trim by tokens instead of characters, e.g.
+        # tiktoken.encoding_for_model("gpt-4o").encode(pdf_summary)[:6000]
+        pdf_summary = pdf_summary or ""
+        if len(pdf_summary) > MAX_PDF_SUMMARY_CHARS:
+            pdf_summary = pdf_summary[:MAX_PDF_SUMMARY_CHARS] + _TRUNCATED_MARKER
+        parts: List[str] = []
+        add = parts.append
+        
+        # Educational context
+        if educational_context:
+            ctx = educational_context.get
+            add(_CONTEXT_TEMPLATE.format_map(_Defaults(educational_context, 'No especificado')))
+            for key, line in _CONTEXT_FIELDS:
+                value = ctx(key)
+                if value:
+                    add(line.format(value))
+            add("")
+        
+        # Structure analysis summary
+        if structure_analysis:
+            sa = structure_analysis.get
+            add(_STRUCTURE_TEMPLATE.format_map(_Defaults(structure_analysis, 0)))
+            
+            sections_found = sa('sections_found')
+            if sections_found:
+                add(f"Secciones encontradas: {', '.join(sections_found)}")
+            
+            # Learning objectives
+            objectives = sa('learning_objectives')
+            if objectives:
+                add(f"\nObjetivos de aprendizaje ({len(objectives)} encontrados):")
+                for i, obj in enumerate(objectives[:5], 1):
+                    add(f"  {i}. {obj[:MAX_OBJECTIVE_CHARS]}")
+            
+            # Activities
+            activities_count = sa('activities_count', 0)
+            if activities_count > 0:
+                add(f"\nActividades planificadas: {activities_count}")
+            
+            # Assessment methods
+            assessment_methods = sa('assessment_methods')
+            if assessment_methods:
+                add(f"Métodos de evaluación: {', '.join(assessment_methods)}")
+            
+            # Resources
+            resources = sa('resources_list')
+            if resources:
+                add(f"Recursos educativos: {', '.join(r[:MAX_RESOURCE_CHARS] for r in resources[:5])}")
+            
+            # Time allocation
+            time_info = sa('time_allocation') or {}
+            total_minutes = time_info.get('total_minutes', 0)
+            if total_minutes > 0:
+                add(f"Tiempo total estimado: {total_minutes} minutos")
+                add(f"Actividades con tiempo asignado: {time_info.get('activities_with_time', 0)}")
+            
+            # Grade level indicators
+            grade_indicators = sa('grade_level_indicators')
+            if grade_indicators:
+                add(f"Indicadores de nivel detectados: {', '.join(grade_indicators)}")
+        
+        # PDF content summary
+        if pdf_summary:
+            add("\n=== CONTENIDO DE LA PLANEACIÓN ===")
+            add(pdf_summary)
+        
+        return "\n".join(parts)
+    
+    def _get_error_feedback(self, error_message: str) -> Dict[str, Any]:
+        """Return error feedback structure for lesson plans using ministerial criteria"""
+        feedback = copy.deepcopy(_ERROR_TEMPLATE)
+        feedback["error"] = error_message
+        return feedback
+
+
+# Batch API states after which the batch's files no longer change
+BATCH_TERMINAL_STATUSES = frozenset({"completed", "failed", "expired", "cancelled"})
+BATCH_POLL_INTERVAL = 30  # seconds
+
+
+class LessonPlanBatchAgent(LessonPlanAgent):
+    """
+    Evaluates many lesson plans at once through the OpenAI Batch API
+    
+    Batch requests cost half as much as regular chat calls and draw on a
+    separate rate-limit pool, at the price of completing asynchronously
+    (within 24h). Use it for school-wide uploads rather than interactive ones.
+    """
+    
+    __slots__ = ()
+    
+    def submit_batch(self, analysis_data_by_id: Dict[str, Dict[str, Any]]) -> str:
+        """
+        Upload one chat completion request per lesson plan and start a batch
+        
+        Args:
+            analysis_data_by_id: analysis_data dicts keyed by a caller-chosen custom_id
+            
+        Returns:
+            The OpenAI batch id
+        """
+        lines = [
+            jsonutil.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": self._completion_params(self._build_messages(analysis_data), stream=False)
+            })
+            for custom_id, analysis_data in analysis_data_by_id.items()
+        ]
+        batch_file = self.client.files.create(
+            file=("lesson_plans.jsonl", "\n".join(lines).encode("utf-8")),
+            purpose="batch"
+        )
+        batch = self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        logging.info(f"Submitted lesson plan batch {batch.id} with {len(lines)} requests")
+        return batch.id
+    
+    def retrieve_batch(self, batch_id: str) -> Any:
+        """Return the current state of a batch"""
+        return self.client.batches.retrieve(batch_id)
+    
+    def wait_for_batch(self, batch_id: str, poll_interval: float = BATCH_POLL_INTERVAL) -> Any:
+        """Block until the batch reaches a terminal status and return it"""
+        while True:
+            batch = self.retrieve_batch(batch_id)
+            if batch.status in BATCH_TERMINAL_STATUSES:
+                return batch
+            time.sleep(poll_interval)
+    
+    def fetch_results(self, batch: Any) -> Dict[str, Dict[str, Any]]:
+        """
+        Download and validate the feedback of a finished batch
+        
+        Returns:
+            Feedback dicts keyed by custom_id; failed requests get error feedback
+        """
+        results: Dict[str, Dict[str, Any]] = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if line.strip():
+                    row = jsonutil.loads(line)
+                    results[row["custom_id"]] = self._batch_row_feedback(row)
+        return results
+    
+    def _batch_row_feedback(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Turn one line of a batch output file into feedback"""
+        response = row.get("response") or {}
+        body = response.get("body") or {}
+        if response.get("status_code") != 200:
+            error = row.get("error") or body.get("error") or {}
+            return self._get_error_feedback(error.get("message", "Batch request failed"))
+        try:
+            feedback = self._validate_feedback(body["choices"][0]["message"]["content"])
+        except Exception as e:
+            logging.error(f"Lesson Plan batch row {row.get('custom_id')} error: {str(e)}")
+            return self._get_error_feedback(str(e))
+        return self.with_metadata(feedback, {})
+
+
+# Stateless, so one instance serves every request
+agent = LessonPlanAgent()
+batch_agent = LessonPlanBatchAgent()
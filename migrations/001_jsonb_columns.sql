@@ -0,0 +1,20 @@
+-- Convert the JSON payload columns from TEXT to JSONB (PostgreSQL only).
+-- SQLite databases need no migration: db.JSON reads the existing JSON text.
+-- Run once before deploying the JSONB models, e.g.
+--   psql "$DATABASE_URL" -f migrations/001_jsonb_columns.sql
+BEGIN;
+
+ALTER TABLE classroom_analysis
+    ALTER COLUMN transcription_data TYPE jsonb USING NULLIF(transcription_data, '')::jsonb,
+    ALTER COLUMN prosody_data TYPE jsonb USING NULLIF(prosody_data, '')::jsonb,
+    ALTER COLUMN lesson_plan_structure TYPE jsonb USING NULLIF(lesson_plan_structure, '')::jsonb,
+    ALTER COLUMN pedagogical_analysis TYPE jsonb USING NULLIF(pedagogical_analysis, '')::jsonb,
+    ALTER COLUMN ric_feedback TYPE jsonb USING NULLIF(ric_feedback, '')::jsonb;
+
+ALTER TABLE IF EXISTS batch_job
+    ALTER COLUMN request_map TYPE jsonb USING NULLIF(request_map, '')::jsonb;
+
+ALTER TABLE IF EXISTS feedback_cache
+    ALTER COLUMN response TYPE jsonb USING NULLIF(response, '')::jsonb;
+
+COMMIT;
@@ -0,0 +1,19 @@
+-- Indexes for the list, filter and dashboard queries on classroom_analysis.
+-- CONCURRENTLY avoids locking writes while the indexes build, so run this
+-- outside a transaction:
+--   psql "$DATABASE_URL" -f migrations/002_classroom_analysis_indexes.sql
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_classroom_analysis_type_ts
+    ON classroom_analysis (analysis_type, upload_timestamp);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_classroom_analysis_type_status_ts
+    ON classroom_analysis (analysis_type, status, upload_timestamp);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_classroom_analysis_status
+    ON classroom_analysis (status);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_classroom_analysis_upload_ts
+    ON classroom_analysis (upload_timestamp);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_classroom_analysis_active
+    ON classroom_analysis (upload_timestamp)
+    WHERE status IN ('uploaded', 'processing');
@@ -0,0 +1,25 @@
+-- Store timestamps as timestamptz filled in by the database clock.
+-- Existing values were written with datetime.utcnow(), so they are read as UTC.
+--   psql "$DATABASE_URL" -f migrations/003_timestamptz_server_defaults.sql
+BEGIN;
+
+ALTER TABLE classroom_analysis
+    ALTER COLUMN upload_timestamp TYPE timestamptz USING upload_timestamp AT TIME ZONE 'UTC',
+    ALTER COLUMN upload_timestamp SET DEFAULT now(),
+    ALTER COLUMN analysis_timestamp TYPE timestamptz USING analysis_timestamp AT TIME ZONE 'UTC';
+
+UPDATE classroom_analysis SET upload_timestamp = now() WHERE upload_timestamp IS NULL;
+ALTER TABLE classroom_analysis ALTER COLUMN upload_timestamp SET NOT NULL;
+
+ALTER TABLE IF EXISTS batch_job
+    ALTER COLUMN created_at TYPE timestamptz USING created_at AT TIME ZONE 'UTC',
+    ALTER COLUMN created_at SET DEFAULT now(),
+    ALTER COLUMN created_at SET NOT NULL,
+    ALTER COLUMN completed_at TYPE timestamptz USING completed_at AT TIME ZONE 'UTC';
+
+ALTER TABLE IF EXISTS feedback_cache
+    ALTER COLUMN created_at TYPE timestamptz USING created_at AT TIME ZONE 'UTC',
+    ALTER COLUMN created_at SET DEFAULT now(),
+    ALTER COLUMN created_at SET NOT NULL;
+
+COMMIT;
@@ -0,0 +1,14 @@
+-- Compress the large text and JSONB payload columns with lz4 (PostgreSQL 14+,
+-- server built --with-lz4). Values over ~2KB are already TOAST-compressed with
+-- pglz; lz4 compresses transcripts about as well and decompresses several
+-- times faster on the detail views. Only newly written values use lz4;
+-- rewrite old rows with VACUUM FULL classroom_analysis if needed.
+--   psql "$DATABASE_URL" -f migrations/004_lz4_column_compression.sql
+ALTER TABLE classroom_analysis
+    ALTER COLUMN transcription_text SET COMPRESSION lz4,
+    ALTER COLUMN pdf_text_content SET COMPRESSION lz4,
+    ALTER COLUMN transcription_data SET COMPRESSION lz4,
+    ALTER COLUMN prosody_data SET COMPRESSION lz4,
+    ALTER COLUMN lesson_plan_structure SET COMPRESSION lz4,
+    ALTER COLUMN pedagogical_analysis SET COMPRESSION lz4,
+    ALTER COLUMN ric_feedback SET COMPRESSION lz4;
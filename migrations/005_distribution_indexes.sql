@@ -0,0 +1,11 @@
+-- Indexes for the dashboard's subject and grade level distributions.
+-- The daily and hourly activity charts group by date() / extract(hour) of a
+-- timestamptz, which depend on the session time zone and so can't be
+-- indexed; they filter on ix_classroom_analysis_upload_ts instead.
+-- Run outside a transaction (CONCURRENTLY):
+--   psql "$DATABASE_URL" -f migrations/005_distribution_indexes.sql
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_classroom_analysis_subject
+    ON classroom_analysis (subject);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_classroom_analysis_grade_level
+    ON classroom_analysis (grade_level);
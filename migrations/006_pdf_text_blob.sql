@@ -0,0 +1,7 @@
+-- Full PDF text moves to the blob store (blob_store.py); rows keep its SHA-256
+-- and a 512-character preview in pdf_text_content. Existing rows keep their
+-- 10K-character prefix and have no hash.
+--   psql "$DATABASE_URL" -f migrations/006_pdf_text_blob.sql
+-- The SQLite fallback needs the column too:
+--   sqlite3 instance/ric.db "ALTER TABLE classroom_analysis ADD COLUMN pdf_text_sha256 VARCHAR(64)"
+ALTER TABLE classroom_analysis ADD COLUMN IF NOT EXISTS pdf_text_sha256 varchar(64);
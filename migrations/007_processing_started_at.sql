@@ -0,0 +1,6 @@
+-- Record when a worker claimed an analysis, so jobs lost with a restarted
+-- worker can be failed instead of staying in 'processing' forever.
+--   psql "$DATABASE_URL" -f migrations/007_processing_started_at.sql
+-- The SQLite fallback needs the column too:
+--   sqlite3 instance/ric.db "ALTER TABLE classroom_analysis ADD COLUMN processing_started_at DATETIME"
+ALTER TABLE classroom_analysis ADD COLUMN IF NOT EXISTS processing_started_at timestamptz;
@@ -0,0 +1,7 @@
+-- Record when an analysis was queued, separately from when a worker started
+-- it (processing_started_at), so jobs waiting behind others in the pool are
+-- not mistaken for jobs lost with a restarted worker.
+--   psql "$DATABASE_URL" -f migrations/008_queued_at.sql
+-- The SQLite fallback needs the column too:
+--   sqlite3 instance/ric.db "ALTER TABLE classroom_analysis ADD COLUMN queued_at DATETIME"
+ALTER TABLE classroom_analysis ADD COLUMN IF NOT EXISTS queued_at timestamptz;
@@ -1,113 +1,113 @@
-from app import db
 from datetime import datetime
-import json
+from functools import cached_property
+from typing import Optional
+from app import db
+import blob_store
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.mutable import MutableDict
+from sqlalchemy.orm import Mapped, mapped_column
+
+
+class JSONDict(db.TypeDecorator):
+    """
+    JSON object column that always reads back as a dict
+    
+    Stored as JSONB on PostgreSQL (parsed once by the database and queryable
+    per key, e.g. ric_feedback->>'overall_score') and as JSON text on the
+    SQLite fallback. NULL reads back as an empty dict.
+    """
+    impl = db.JSON
+    cache_ok = True
+    
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(JSONB())
+        return dialect.type_descriptor(db.JSON())
+    
+    def process_result_value(self, value, dialect):
+        return {} if value is None else value
+
+
+# Top-level key assignments (row.prosody_data['pitch'] = ...) mark the row dirty
+JSONType = MutableDict.as_mutable(JSONDict)
+
 
 class ClassroomAnalysis(db.Model):
     """Unified model for both audio and PDF lesson analysis"""
-    id = db.Column(db.Integer, primary_key=True)
-    filename = db.Column(db.String(255), nullable=False)
-    original_filename = db.Column(db.String(255), nullable=False)
-    upload_timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-    analysis_timestamp = db.Column(db.DateTime)
+    id: Mapped[int] = mapped_column(primary_key=True)
+    filename: Mapped[str] = mapped_column(db.String(255))
+    original_filename: Mapped[str] = mapped_column(db.String(255))
+    # Timestamps come from the database clock, so every worker agrees on them
+    upload_timestamp: Mapped[datetime] = mapped_column(db.DateTime(timezone=True), server_default=db.func.now())
+    analysis_timestamp: Mapped[Optional[datetime]] = mapped_column(db.DateTime(timezone=True))
     
     # Analysis type
-    analysis_type = db.Column(db.String(20), default='audio')  # 'audio', 'pdf' or 'video'
+    analysis_type: Mapped[Optional[str]] = mapped_column(db.String(20), default='audio')  # 'audio', 'pdf' or 'video'
     
     # Educational context (shared)
-    subject = db.Column(db.String(100))  # Materia/asignatura
-    grade_level = db.Column(db.String(50))  # Grado escolar
-    lesson_topic = db.Column(db.String(255))  # Tema de la clase
-    additional_context = db.Column(db.Text)  # Contexto adicional
+    subject: Mapped[Optional[str]] = mapped_column(db.String(100))  # Materia/asignatura
+    grade_level: Mapped[Optional[str]] = mapped_column(db.String(50))  # Grado escolar
+    lesson_topic: Mapped[Optional[str]] = mapped_column(db.String(255))  # Tema de la clase
+    additional_context: Mapped[Optional[str]] = mapped_column(db.Text)  # Contexto adicional
     
     # PDF-specific context
-    lesson_duration = db.Column(db.Integer)  # Duration in minutes
-    student_count = db.Column(db.Integer)  # Number of students
-    learning_objectives = db.Column(db.Text)  # Extracted learning objectives
+    lesson_duration: Mapped[Optional[int]]  # Duration in minutes
+    student_count: Mapped[Optional[int]]  # Number of students
+    learning_objectives: Mapped[Optional[str]] = mapped_column(db.Text)  # Extracted learning objectives
+    
+    # Results are large and only needed on detail views, so they are deferred:
+    # list queries never fetch them, and detail queries load the 'payload'
+    # group in one go (undefer_group('payload'))
     
     # Audio-specific results (nullable for PDF analysis)
-    transcription_text = db.Column(db.Text)
-    transcription_data = db.Column(db.Text)  # JSON string for detailed transcription
-    prosody_data = db.Column(db.Text)  # JSON string for prosodic metrics
+    transcription_text: Mapped[Optional[str]] = mapped_column(db.Text, deferred=True)
+    transcription_data: Mapped[Optional[dict]] = mapped_column(JSONType, deferred=True, deferred_group='payload')  # Detailed transcription
+    prosody_data: Mapped[Optional[dict]] = mapped_column(JSONType, deferred=True, deferred_group='payload')  # Prosodic metrics
     
     # PDF-specific results (nullable for audio analysis)
-    pdf_text_content = db.Column(db.Text)  # Extracted PDF text
-    lesson_plan_structure = db.Column(db.Text)  # JSON string for lesson structure analysis
-    pedagogical_analysis = db.Column(db.Text)  # JSON string for pedagogical feedback
+    # Full extracted text lives in the blob store (get_full_pdf_text()); the row
+    # keeps its SHA-256 and a short preview
+    pdf_text_content: Mapped[Optional[str]] = mapped_column(db.Text, deferred=True)  # Preview of the extracted PDF text
+    pdf_text_sha256: Mapped[Optional[str]] = mapped_column(db.String(64), deferred=True)
+    lesson_plan_structure: Mapped[Optional[dict]] = mapped_column(JSONType, deferred=True, deferred_group='payload')  # Lesson structure analysis
+    pedagogical_analysis: Mapped[Optional[dict]] = mapped_column(JSONType, deferred=True, deferred_group='payload')  # Pedagogical feedback
     
     # AI feedback (shared for both types)
-    ric_feedback = db.Column(db.Text)  # JSON string for AI-generated feedback
+    ric_feedback: Mapped[Optional[dict]] = mapped_column(JSONType, deferred=True, deferred_group='payload')  # AI-generated feedback
     
     # Analysis status
-    status = db.Column(db.String(50), default='uploaded')  # uploaded, processing, completed, error
-    error_message = db.Column(db.Text)
-    
-    def get_transcription_data(self):
-        """Parse transcription data from JSON"""
-        if self.transcription_data:
-            try:
-                return json.loads(self.transcription_data)
-            except json.JSONDecodeError:
-                return {}
-        return {}
-    
-    def set_transcription_data(self, data):
-        """Store transcription data as JSON"""
-        self.transcription_data = json.dumps(data)
-    
-    def get_prosody_data(self):
-        """Parse prosody data from JSON"""
-        if self.prosody_data:
-            try:
-                return json.loads(self.prosody_data)
-            except json.JSONDecodeError:
-                return {}
-        return {}
-    
-    def set_prosody_data(self, data):
-        """Store prosody data as JSON"""
-        self.prosody_data = json.dumps(data)
-    
-    def get_ric_feedback(self):
-        """Parse RIC feedback from JSON"""
-        if self.ric_feedback:
-            try:
-                return json.loads(self.ric_feedback)
-            except json.JSONDecodeError:
-                return {}
-        return {}
-    
-    def set_ric_feedback(self, data):
-        """Store RIC feedback as JSON"""
-        self.ric_feedback = json.dumps(data)
-    
-    def get_lesson_plan_structure(self):
-        """Parse lesson plan structure from JSON"""
-        if self.lesson_plan_structure:
-            try:
-                return json.loads(self.lesson_plan_structure)
-            except json.JSONDecodeError:
-                return {}
-        return {}
-    
-    def set_lesson_plan_structure(self, data):
-        """Store lesson plan structure as JSON"""
-        self.lesson_plan_structure = json.dumps(data)
-    
-    def get_pedagogical_analysis(self):
-        """Parse pedagogical analysis from JSON"""
-        if self.pedagogical_analysis:
-            try:
-                return json.loads(self.pedagogical_analysis)
-            except json.JSONDecodeError:
-                return {}
-        return {}
-    
-    def set_pedagogical_analysis(self, data):
-        """Store pedagogical analysis as JSON"""
-        self.pedagogical_analysis = json.dumps(data)
-    
-    def get_educational_context(self):
-        """Get educational context as dictionary"""
+    status: Mapped[Optional[str]] = mapped_column(db.String(50), default='uploaded')  # uploaded, processing, completed, error
+    queued_at: Mapped[Optional[datetime]] = mapped_column(db.DateTime(timezone=True))  # When the analysis was claimed and queued
+    processing_started_at: Mapped[Optional[datetime]] = mapped_column(db.DateTime(timezone=True))  # When a worker started running it
+    error_message: Mapped[Optional[str]] = mapped_column(db.Text)
+    
+    __table_args__ = (
+        # Recent analyses of one type (upload pages) and type/status breakdowns
+        db.Index('ix_classroom_analysis_type_ts', 'analysis_type', 'upload_timestamp'),
+        db.Index('ix_classroom_analysis_type_status_ts', 'analysis_type', 'status', 'upload_timestamp'),
+        # Status counts, and the history / dashboard ordering and date ranges
+        db.Index('ix_classroom_analysis_status', 'status'),
+        db.Index('ix_classroom_analysis_upload_ts', 'upload_timestamp'),
+        # Subject / grade distributions on the dashboard (index-only GROUP BY)
+        db.Index('ix_classroom_analysis_subject', 'subject'),
+        db.Index('ix_classroom_analysis_grade_level', 'grade_level'),
+        # Unfinished jobs are a small slice of the table, so index only those rows
+        db.Index(
+            'ix_classroom_analysis_active', 'upload_timestamp',
+            postgresql_where=db.text("status IN ('uploaded', 'processing')"),
+            sqlite_where=db.text("status IN ('uploaded', 'processing')")
+        ),
+    )
+    
+    @cached_property
+    def educational_context(self):
+        """
+        Educational context as dictionary
+        
+        Computed once per loaded row; dropped again whenever one of its
+        columns is set or the row is refreshed or expired (see listeners below).
+        """
         context = {
             'subject': self.subject or 'General',
             'grade_level': self.grade_level or 'No especificado',
@@ -126,6 +126,21 @@ class ClassroomAnalysis(db.Model):
         
         return context
     
+    def get_educational_context(self):
+        """Get educational context as dictionary"""
+        return self.educational_context
+    
+    def get_full_pdf_text(self):
+        """
+        Full extracted PDF text, or None if it isn't available
+        
+        Rows analyzed before the blob store only kept the first 10K characters
+        in pdf_text_content, so those are returned as-is.
+        """
+        if self.pdf_text_sha256:
+            return blob_store.get_text(self.pdf_text_sha256)
+        return self.pdf_text_content
+    
     def is_audio_analysis(self):
         """Check if this is an audio analysis"""
         return self.analysis_type == 'audio'
@@ -139,5 +154,39 @@ class ClassroomAnalysis(db.Model):
         return self.analysis_type == 'video'
 
 
+_EDUCATIONAL_CONTEXT_COLUMNS = (
+    'subject', 'grade_level', 'lesson_topic', 'additional_context', 'analysis_type',
+    'lesson_duration', 'student_count', 'learning_objectives'
+)
+
+
+def _reset_educational_context(target, *args):
+    target.__dict__.pop('educational_context', None)
+
+
+# Reloaded rows (refresh, expire on commit) and in-place edits both drop the cached context
+for _event_name in ('refresh', 'refresh_flush', 'expire'):
+    event.listen(ClassroomAnalysis, _event_name, _reset_educational_context)
+for _column in _EDUCATIONAL_CONTEXT_COLUMNS:
+    event.listen(getattr(ClassroomAnalysis, _column), 'set', _reset_educational_context)
+
+
+class BatchJob(db.Model):
+    """OpenAI Batch API job evaluating several lesson plans at once"""
+    id: Mapped[int] = mapped_column(primary_key=True)
+    batch_id: Mapped[str] = mapped_column(db.String(100), unique=True)  # OpenAI batch id
+    status: Mapped[Optional[str]] = mapped_column(db.String(50), default='submitted')  # submitted, completed, failed, expired, cancelled
+    request_map: Mapped[Optional[dict]] = mapped_column(JSONType)  # custom_id -> ClassroomAnalysis.id
+    created_at: Mapped[datetime] = mapped_column(db.DateTime(timezone=True), server_default=db.func.now())
+    completed_at: Mapped[Optional[datetime]] = mapped_column(db.DateTime(timezone=True))
+
+
+class FeedbackCache(db.Model):
+    """Feedback stored by prompt cache key, reused for identical lesson plans and sessions"""
+    key: Mapped[str] = mapped_column(db.String(32), primary_key=True)  # LessonPlanAgent / RICAgent .cache_key()
+    response: Mapped[dict] = mapped_column(JSONType)  # Feedback dict
+    created_at: Mapped[datetime] = mapped_column(db.DateTime(timezone=True), server_default=db.func.now())
+
+
 # Keep backward compatibility alias
 AudioAnalysis = ClassroomAnalysis
@@ -0,0 +1,92 @@
+"""Process-wide OpenAI clients shared by the agents and processors"""
+import os
+import asyncio
+import weakref
+import threading
+import importlib.util
+from typing import Any
+import httpx
+from openai import OpenAI, AsyncOpenAI
+
+# A single pooled HTTP client per process, shared by every agent instance, so
+# calls reuse warm connections instead of paying a TCP + TLS handshake.
+# HTTP/2 (when the h2 package is installed) multiplexes concurrent requests
+# over one connection. Each gthread worker thread (GUNICORN_THREADS, as in
+# gunicorn.conf.py) makes at most one call at a time, so that many
+# connections are kept warm, with as many again allowed for the analysis
+# pool and batch / per-criterion fan-out bursts.
+_HTTP2 = importlib.util.find_spec("h2") is not None
+_WORKER_THREADS = int(os.environ.get("GUNICORN_THREADS", "32"))
+_HTTP_LIMITS = httpx.Limits(max_connections=2 * _WORKER_THREADS, max_keepalive_connections=_WORKER_THREADS)
+_HTTP_TIMEOUT = 60.0
+
+# Transient failures (429, 5xx, timeouts, dropped connections) are retried by
+# the SDK itself with jittered exponential backoff that honors Retry-After,
+# instead of surfacing as error feedback on the first hiccup
+OPENAI_MAX_RETRIES = 5
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> OpenAI:
+    """Return the process-wide OpenAI client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                http_client = httpx.Client(
+                    http2=_HTTP2,
+                    limits=_HTTP_LIMITS,
+                    timeout=_HTTP_TIMEOUT
+                )
+                _client = OpenAI(
+                    api_key=os.environ.get("OPENAI_API_KEY"),
+                    http_client=http_client,
+                    max_retries=OPENAI_MAX_RETRIES
+                )
+    return _client
+
+
+# httpx.AsyncClient connections are bound to the event loop that opened them,
+# so async work from every thread runs on one long-lived loop in a background
+# thread, keeping a single AsyncOpenAI (and its warm connections) for the life
+# of the process. Clients for any other loop are pooled per loop and dropped
+# when the loop goes away.
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_async_client() -> AsyncOpenAI:
+    """Return the AsyncOpenAI client for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        http_client = httpx.AsyncClient(
+            http2=_HTTP2,
+            limits=_HTTP_LIMITS,
+            timeout=_HTTP_TIMEOUT
+        )
+        client = _async_clients[loop] = AsyncOpenAI(
+            api_key=os.environ.get("OPENAI_API_KEY"),
+            http_client=http_client,
+            max_retries=OPENAI_MAX_RETRIES
+        )
+    return client
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """Return the process-wide background event loop, starting it on first use"""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="openai-loop", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def run_async(coro: Any) -> Any:
+    """Run coro on the shared background event loop and wait for its result"""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
@@ -1,64 +1,221 @@
+import os
 import re
+import copy
+import hashlib
 import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
+from types import MappingProxyType
 from PyPDF2 import PdfReader
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
+from cache import TTLCache
+
+try:
+    import pymupdf as fitz  # PyMuPDF; the bare "fitz" name is deprecated
+except ImportError:  # pragma: no cover - optional speedup
+    fitz = None
+
+try:
+    import ahocorasick
+except ImportError:  # pragma: no cover - optional speedup
+    ahocorasick = None
+
+
+def _clean_replacement(match) -> str:
+    """Page markers vanish, whitespace runs become a single space"""
+    return '' if match.group().startswith('-') else ' '
+
+
+# Minutes per time unit, keyed by the unit's first letter (minutos / horas, hrs)
+_MINUTES_PER_UNIT = {'m': 1, 'h': 60}
+
+
+# Structure analyses by text digest; the analysis is deterministic in its input,
+# so re-uploads and retried LLM steps for the same plan skip the regex work
+_STRUCTURE_CACHE = TTLCache(maxsize=128)
+
+
+def _keyword_automaton(keywords: Dict[str, str]):
+    """Aho-Corasick automaton mapping each keyword to its label, or None without pyahocorasick"""
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for keyword, label in keywords.items():
+        automaton.add_word(keyword, label)
+    automaton.make_automaton()
+    return automaton
+
+
+# Long PDFs are split into page ranges extracted by a process pool. PyMuPDF is
+# not thread-safe and holds the GIL, so threads would not help; each worker
+# process opens its own copy of the document instead.
+PARALLEL_EXTRACT_MIN_PAGES = 16
+PDF_EXTRACT_WORKERS = int(os.environ.get("PDF_EXTRACT_WORKERS", min(4, os.cpu_count() or 1)))
+_extract_pool = None
+_extract_pool_lock = threading.Lock()
+
+
+def _get_extract_pool() -> ProcessPoolExecutor:
+    """Process pool for page extraction, created on first use"""
+    global _extract_pool
+    if _extract_pool is None:
+        with _extract_pool_lock:
+            if _extract_pool is None:
+                # spawn, not fork: the web worker forking this pool runs threads
+                _extract_pool = ProcessPoolExecutor(
+                    max_workers=PDF_EXTRACT_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+    return _extract_pool
+
+
+def _page_text(page, page_num: int) -> Optional[str]:
+    """
+    Text of a PyMuPDF page, or None if it has none or fails to extract
+    
+    A page that references no fonts (a scanned image, a large diagram) can't
+    hold any text, so it is skipped before get_text() interprets its drawing
+    operators, which on graphics-heavy pages is where nearly all the time goes.
+    """
+    try:
+        if not page.get_fonts():
+            logging.warning(f"Skipping page {page_num + 1}: no text layer (graphics only)")
+            return None
+        return page.get_text("text")
+    except Exception as e:
+        logging.warning(f"Error extracting text from page {page_num + 1}: {str(e)}")
+        return None
+
+
+def _extract_page_range(pdf_file_path: str, start: int, stop: int) -> List[Optional[str]]:
+    """Text of pages [start, stop) with PyMuPDF; None for pages without text"""
+    with fitz.open(pdf_file_path) as doc:
+        return [_page_text(doc[page_num], page_num) for page_num in range(start, stop)]
+
 
 class PDFProcessor:
     """PDF processing for lesson plan text extraction and analysis"""
     
-    def __init__(self):
-        # Common section headers in Spanish lesson plans
-        self.section_patterns = {
-            'objetivos': [
-                r'objetivos?\s+(?:de\s+)?(?:aprendizaje|específicos?|generales?)',
-                r'propósitos?\s+(?:de\s+la\s+)?(?:clase|lección)',
-                r'metas?\s+(?:de\s+)?aprendizaje',
-                r'qué\s+aprenderán',
-                r'logros?\s+esperados?'
-            ],
-            'contenidos': [
-                r'contenidos?\s+(?:temáticos?|curriculares?)?',
-                r'temas?\s+(?:a\s+)?(?:desarrollar|tratar)',
-                r'materias?\s+(?:de\s+estudio)?',
-                r'conceptos?\s+(?:clave|principales?)'
-            ],
-            'actividades': [
-                r'actividades?\s+(?:de\s+)?(?:aprendizaje|enseñanza)?',
-                r'estrategias?\s+(?:didácticas?|metodológicas?)',
-                r'desarrollo\s+(?:de\s+la\s+)?clase',
-                r'secuencia\s+didáctica',
-                r'metodología'
-            ],
-            'evaluacion': [
-                r'evaluación\s+(?:de\s+)?(?:aprendizajes?)?',
-                r'assessment',
-                r'criterios?\s+de\s+evaluación',
-                r'instrumentos?\s+de\s+evaluación',
-                r'rúbricas?'
-            ],
-            'recursos': [
-                r'recursos?\s+(?:didácticos?|educativos?)?',
-                r'materiales?\s+(?:educativos?|de\s+apoyo)?',
-                r'herramientas?',
-                r'tecnología\s+educativa'
-            ],
-            'tiempo': [
-                r'tiempo\s+(?:estimado|asignado)',
-                r'duración\s+(?:de\s+la\s+)?(?:clase|actividad)',
-                r'cronograma',
-                r'distribución\s+del\s+tiempo'
-            ]
-        }
+    # Keyword tables and their compiled regexes are read-only class attributes,
+    # built once per process rather than for every per-request instance
+    
+    # Common section headers in Spanish lesson plans
+    section_patterns = MappingProxyType({
+        'objetivos': (
+            r'objetivos?\s+(?:de\s+)?(?:aprendizaje|específicos?|generales?)',
+            r'propósitos?\s+(?:de\s+la\s+)?(?:clase|lección)',
+            r'metas?\s+(?:de\s+)?aprendizaje',
+            r'qué\s+aprenderán',
+            r'logros?\s+esperados?'
+        ),
+        'contenidos': (
+            r'contenidos?\s+(?:temáticos?|curriculares?)?',
+            r'temas?\s+(?:a\s+)?(?:desarrollar|tratar)',
+            r'materias?\s+(?:de\s+estudio)?',
+            r'conceptos?\s+(?:clave|principales?)'
+        ),
+        'actividades': (
+            r'actividades?\s+(?:de\s+)?(?:aprendizaje|enseñanza)?',
+            r'estrategias?\s+(?:didácticas?|metodológicas?)',
+            r'desarrollo\s+(?:de\s+la\s+)?clase',
+            r'secuencia\s+didáctica',
+            r'metodología'
+        ),
+        'evaluacion': (
+            r'evaluación\s+(?:de\s+)?(?:aprendizajes?)?',
+            r'assessment',
+            r'criterios?\s+de\s+evaluación',
+            r'instrumentos?\s+de\s+evaluación',
+            r'rúbricas?'
+        ),
+        'recursos': (
+            r'recursos?\s+(?:didácticos?|educativos?)?',
+            r'materiales?\s+(?:educativos?|de\s+apoyo)?',
+            r'herramientas?',
+            r'tecnología\s+educativa'
+        ),
+        'tiempo': (
+            r'tiempo\s+(?:estimado|asignado)',
+            r'duración\s+(?:de\s+la\s+)?(?:clase|actividad)',
+            r'cronograma',
+            r'distribución\s+del\s+tiempo'
+        )
+    })
+    
+    # Common grade level indicators
+    grade_indicators = MappingProxyType({
+        'preescolar': ('preescolar', 'jardín', 'kinder', 'inicial'),
+        'primaria_baja': ('1°', '2°', '3°', 'primero', 'segundo', 'tercero', 'grado'),
+        'primaria_alta': ('4°', '5°', '6°', 'cuarto', 'quinto', 'sexto'),
+        'secundaria': ('7°', '8°', '9°', 'séptimo', 'octavo', 'noveno', 'secundaria'),
+        'bachillerato': ('10°', '11°', '12°', 'décimo', 'once', 'doce', 'bachillerato', 'preparatoria')
+    })
+    
+    assessment_keywords = (
+        'observación', 'rúbrica', 'lista de cotejo', 'portafolio',
+        'examen', 'prueba', 'quiz', 'proyecto', 'presentación',
+        'autoevaluación', 'coevaluación', 'heteroevaluación'
+    )
+
+    @classmethod
+    def _compile_patterns(cls):
+        """
+        Compile every regex once per process, at import
         
-        # Common grade level indicators
-        self.grade_indicators = {
-            'preescolar': ['preescolar', 'jardín', 'kinder', 'inicial'],
-            'primaria_baja': ['1°', '2°', '3°', 'primero', 'segundo', 'tercero', 'grado'],
-            'primaria_alta': ['4°', '5°', '6°', 'cuarto', 'quinto', 'sexto'],
-            'secundaria': ['7°', '8°', '9°', 'séptimo', 'octavo', 'noveno', 'secundaria'],
-            'bachillerato': ['10°', '11°', '12°', 'décimo', 'once', 'doce', 'bachillerato', 'preparatoria']
-        }
+        Patterns are case-insensitive so no lowercased copies of the text are needed.
+        """
+        flags = re.MULTILINE | re.IGNORECASE
+        # Page markers are dropped and whitespace runs collapsed in the same pass
+        cls._clean_re = re.compile(r'--- Página \d+ ---|\s+')
+        # All section headers in one alternation; the named group that matched
+        # ("<section>__<n>") tells which section a header belongs to
+        cls._section_union = re.compile("|".join(
+            f"(?P<{section_name}__{i}>{pattern})"
+            for section_name, patterns in cls.section_patterns.items()
+            for i, pattern in enumerate(patterns)
+        ), re.IGNORECASE)
+        # Numbered/bulleted items, "que / los estudiantes ..." and action verbs, one group each
+        cls._objective_re = re.compile(
+            r'(?:^|\n)\s*(?:'
+            r'[\d\-\*•]\s*(.+?)'
+            r'|(?:que|el estudiante|los estudiantes?)\s+(.+?)'
+            r'|(?:identificar|reconocer|comprender|analizar|aplicar|evaluar)\s+(.+?)'
+            r')(?=\n|$)',
+            flags
+        )
+        cls._activity_res = [re.compile(pattern, flags) for pattern in (
+            r'(?:^|\n)\s*[\d\-\*•]\s*(?:actividad|ejercicio|tarea)',
+            r'(?:primera|segunda|tercera|cuarta|quinta)\s+(?:actividad|fase)',
+            r'(?:inicio|desarrollo|cierre)\s*:',
+            r'(?:^|\n)\s*(?:paso|etapa)\s+\d+'
+        )]
+        cls._resource_res = [re.compile(pattern, flags) for pattern in (
+            r'(?:^|\n)\s*[\d\-\*•]\s*(.+?)(?=\n|$)',
+            r'(?:libro|texto|material|recurso|herramienta)\s*:?\s*(.+?)(?=\n|$)'
+        )]
+        # Keyword scans look for every keyword in one pass over the text
+        cls._grade_automaton = _keyword_automaton({
+            indicator: level
+            for level, indicators in cls.grade_indicators.items()
+            for indicator in indicators
+        })
+        # Fallback grade scan: a lookahead reports indicators that overlap
+        # (e.g. '1°' inside '11°') just like substring checks would
+        cls._grade_re = re.compile("(?=" + "|".join(
+            f"(?P<{level}>{'|'.join(re.escape(indicator) for indicator in indicators)})"
+            for level, indicators in cls.grade_indicators.items()
+        ) + ")", re.IGNORECASE)
+        cls._assessment_automaton = _keyword_automaton({
+            keyword: keyword for keyword in cls.assessment_keywords
+        })
+        # Without pyahocorasick, one alternation still finds every keyword in a single scan
+        cls._assessment_re = re.compile(
+            "|".join(re.escape(keyword) for keyword in cls.assessment_keywords), re.IGNORECASE
+        )
+        # Amount and unit in one pattern; the unit's first letter picks the multiplier
+        cls._time_re = re.compile(r'(\d+)\s*(minutos?|min\.?|horas?|hrs?\.?)', re.IGNORECASE)
 
     def extract_text_from_pdf(self, pdf_file_path: str) -> str:
         """
@@ -73,47 +230,136 @@ class PDFProcessor:
         try:
             logging.info(f"Starting PDF text extraction from {pdf_file_path}")
             
-            with open(pdf_file_path, 'rb') as file:
-                reader = PdfReader(file)
-                
-                text_content = []
-                
-                for page_num, page in enumerate(reader.pages):
-                    try:
-                        page_text = page.extract_text()
-                        if page_text.strip():
-                            text_content.append(f"--- Página {page_num + 1} ---\n{page_text}")
-                    except Exception as e:
-                        logging.warning(f"Error extracting text from page {page_num + 1}: {str(e)}")
-                        continue
-                
-                full_text = "\n\n".join(text_content)
-                
-                if not full_text.strip():
-                    raise Exception("No se pudo extraer texto del PDF")
-                
-                logging.info(f"Successfully extracted {len(full_text)} characters from PDF")
-                return full_text
+            text_content = []
+            
+            for page_num, page_text in self._iter_page_texts(pdf_file_path):
+                if page_text.strip():
+                    text_content.append(f"--- Página {page_num + 1} ---\n{page_text}")
+            
+            full_text = "\n\n".join(text_content)
+            
+            if not full_text.strip():
+                raise Exception("No se pudo extraer texto del PDF")
+            
+            logging.info(f"Successfully extracted {len(full_text)} characters from PDF")
+            return full_text
                 
         except Exception as e:
             logging.error(f"PDF text extraction error: {str(e)}")
             raise e
 
-    def analyze_lesson_plan_structure(self, text: str) -> Dict:
+    def extract_clean_text_from_pdf(self, pdf_file_path: str) -> Tuple[str, int]:
+        """
+        Extract normalized text from PDF file, cleaning it page by page
+        
+        Unlike extract_text_from_pdf, no page-marked copy of the document is
+        built: each page is cleaned as it is read, so the whole text is only
+        assembled once. The result can go straight to
+        analyze_lesson_plan_structure(text, page_count).
+        
+        Args:
+            pdf_file_path: Path to the PDF file
+            
+        Returns:
+            Tuple of (cleaned text, number of pages with text)
+        """
+        try:
+            logging.info(f"Starting PDF text extraction from {pdf_file_path}")
+            
+            pages = [page_text for _, page_text in self._iter_pages(pdf_file_path)]
+            if not pages:
+                raise Exception("No se pudo extraer texto del PDF")
+            
+            cleaned_text = " ".join(pages)
+            logging.info(f"Successfully extracted {len(cleaned_text)} characters from PDF")
+            return cleaned_text, len(pages)
+            
+        except Exception as e:
+            logging.error(f"PDF text extraction error: {str(e)}")
+            raise e
+
+    def _iter_pages(self, pdf_file_path: str) -> Iterator[Tuple[int, str]]:
+        """Yield (page index, cleaned text) for every page with text"""
+        for page_num, page_text in self._iter_page_texts(pdf_file_path):
+            cleaned = self._clean_text(page_text)
+            if cleaned:
+                yield page_num, cleaned
+
+    def _iter_page_texts(self, pdf_file_path: str) -> Iterator[Tuple[int, str]]:
+        """
+        Yield (page index, text) for every readable page
+        
+        Uses PyMuPDF when installed (text extraction runs in MuPDF's C code)
+        and PyPDF2 otherwise. Pages that fail to extract are logged and skipped.
+        """
+        if fitz is not None:
+            doc = fitz.open(pdf_file_path)
+            if PDF_EXTRACT_WORKERS > 1 and doc.page_count >= PARALLEL_EXTRACT_MIN_PAGES:
+                page_count = doc.page_count
+                doc.close()
+                yield from self._iter_page_texts_parallel(pdf_file_path, page_count)
+                return
+            try:
+                for page_num, page in enumerate(doc):
+                    page_text = _page_text(page, page_num)
+                    if page_text is not None:
+                        yield page_num, page_text
+            finally:
+                doc.close()
+            return
+        
+        # PyPDF2 issues many small seek()/read() calls while parsing; serving
+        # them from memory avoids a syscall for each
+        with open(pdf_file_path, 'rb') as file:
+            buffer = BytesIO(file.read())
+        reader = PdfReader(buffer)
+        for page_num, page in enumerate(reader.pages):
+            try:
+                yield page_num, page.extract_text()
+            except Exception as e:
+                logging.warning(f"Error extracting text from page {page_num + 1}: {str(e)}")
+    
+    def _iter_page_texts_parallel(self, pdf_file_path: str, page_count: int) -> Iterator[Tuple[int, str]]:
+        """Yield (page index, text) in order, extracting page ranges in the process pool"""
+        step = -(-page_count // PDF_EXTRACT_WORKERS)
+        starts = range(0, page_count, step)
+        chunks = _get_extract_pool().map(
+            _extract_page_range,
+            [pdf_file_path] * len(starts),
+            starts,
+            [min(start + step, page_count) for start in starts]
+        )
+        for start, texts in zip(starts, chunks):
+            for page_num, page_text in enumerate(texts, start):
+                if page_text is not None:
+                    yield page_num, page_text
+    
+    def analyze_lesson_plan_structure(self, text: str, page_count: Optional[int] = None) -> Dict:
         """
         Analyze lesson plan structure from extracted text
         
         Args:
-            text: Extracted PDF text
+            text: Extracted PDF text, or already cleaned text when page_count is given
+            page_count: Number of pages, as returned by extract_clean_text_from_pdf
             
         Returns:
             Dictionary with structured lesson plan analysis
         """
+        cache_key = hashlib.blake2b(f"{page_count}\0{text}".encode(), digest_size=16).hexdigest()
+        cached = _STRUCTURE_CACHE.get(cache_key)
+        if cached is not None:
+            logging.info("Lesson plan structure analysis served from cache")
+            return copy.deepcopy(cached)
+        
         try:
             logging.info("Starting lesson plan structure analysis")
             
-            # Clean and normalize text
-            cleaned_text = self._clean_text(text)
+            # Clean and normalize text, unless extract_clean_text_from_pdf already did
+            if page_count is None:
+                cleaned_text = self._clean_text(text)
+                page_count = text.count('--- Página')
+            else:
+                cleaned_text = text
             
             # Extract sections
             sections = self._extract_sections(cleaned_text)
@@ -121,7 +367,7 @@ class PDFProcessor:
             # Analyze content structure
             structure_analysis = {
                 'total_words': len(cleaned_text.split()),
-                'total_pages': text.count('--- Página'),
+                'total_pages': page_count,
                 'sections_found': list(sections.keys()),
                 'sections_content': sections,
                 'grade_level_indicators': self._detect_grade_level(cleaned_text),
@@ -136,6 +382,7 @@ class PDFProcessor:
             structure_analysis['completeness_score'] = self._calculate_completeness_score(sections)
             
             logging.info("Lesson plan structure analysis completed")
+            _STRUCTURE_CACHE.set(cache_key, copy.deepcopy(structure_analysis))
             return structure_analysis
             
         except Exception as e:
@@ -144,60 +391,59 @@ class PDFProcessor:
 
     def _clean_text(self, text: str) -> str:
         """Clean and normalize extracted text"""
-        # Remove excessive whitespace and normalize
-        text = re.sub(r'\s+', ' ', text)
-        text = re.sub(r'\n+', '\n', text)
-        # Remove page markers for content analysis
-        text = re.sub(r'--- Página \d+ ---', '', text)
-        return text.strip()
+        # Collapse whitespace and remove page markers for content analysis
+        return self._clean_re.sub(_clean_replacement, text).strip()
 
     def _extract_sections(self, text: str) -> Dict[str, str]:
         """Extract different sections from the lesson plan"""
         sections = {}
-        text_lower = text.lower()
         
-        for section_name, patterns in self.section_patterns.items():
-            section_content = ""
+        # One scan collects every section header in document order
+        headers = []
+        for match in self._section_union.finditer(text):
+            section_name, _, index = match.lastgroup.rpartition('__')
+            headers.append((match.start(), section_name, int(index)))
+        
+        # A section starts at its highest-priority pattern that matches (the
+        # earliest one in section_patterns), at that pattern's first hit; a
+        # weak pattern only counts when no stronger one matched
+        section_start = {}
+        for start_pos, section_name, index in headers:
+            best = section_start.get(section_name)
+            if best is None or index < best[0]:
+                section_start[section_name] = (index, start_pos)
+        
+        for section_name in self.section_patterns:
+            if section_name not in section_start:
+                continue
+            start_pos = section_start[section_name][1]
             
-            for pattern in patterns:
-                match = re.search(pattern, text_lower)
-                if match:
-                    start_pos = match.start()
-                    # Find the end of this section (next section or end of text)
-                    end_pos = len(text)
-                    
-                    # Look for the next section
-                    next_sections = []
-                    for other_section, other_patterns in self.section_patterns.items():
-                        if other_section != section_name:
-                            for other_pattern in other_patterns:
-                                other_match = re.search(other_pattern, text_lower[start_pos + 50:])
-                                if other_match:
-                                    next_sections.append(start_pos + 50 + other_match.start())
-                    
-                    if next_sections:
-                        end_pos = min(next_sections)
-                    
-                    section_content = text[start_pos:end_pos].strip()
-                    break
+            # The section runs until the next header of another section
+            # (at least 50 characters on), or to the end of the text
+            end_pos = next(
+                (pos for pos, other_section, _ in headers
+                 if pos >= start_pos + 50 and other_section != section_name),
+                len(text)
+            )
+            # Limit to prevent excessive data; capping before slicing keeps a
+            # section that runs to the end of the document from copying all of it
+            end_pos = min(end_pos, start_pos + 1000)
+            section_content = text[start_pos:end_pos].strip()
             
             if section_content:
-                sections[section_name] = section_content[:1000]  # Limit to prevent excessive data
+                sections[section_name] = section_content
         
         return sections
 
     def _detect_grade_level(self, text: str) -> List[str]:
         """Detect grade level indicators in the text"""
-        detected_levels = []
-        text_lower = text.lower()
-        
-        for level, indicators in self.grade_indicators.items():
-            for indicator in indicators:
-                if indicator in text_lower:
-                    detected_levels.append(level)
-                    break
+        if self._grade_automaton is not None:
+            # The automaton is case-sensitive, so it scans a lowercased copy
+            found = {level for _, level in self._grade_automaton.iter(text.lower())}
+        else:
+            found = {match.lastgroup for match in self._grade_re.finditer(text)}
         
-        return detected_levels
+        return [level for level in self.grade_indicators if level in found]
 
     def _extract_learning_objectives(self, objectives_text: str) -> List[str]:
         """Extract learning objectives from objectives section"""
@@ -207,17 +453,14 @@ class PDFProcessor:
             return objectives
         
         # Look for numbered or bulleted objectives
-        patterns = [
-            r'(?:^|\n)\s*[\d\-\*•]\s*(.+?)(?=\n|$)',
-            r'(?:^|\n)\s*(?:que|el estudiante|los estudiantes?)\s+(.+?)(?=\n|$)',
-            r'(?:^|\n)\s*(?:identificar|reconocer|comprender|analizar|aplicar|evaluar)\s+(.+?)(?=\n|$)'
-        ]
-        
-        for pattern in patterns:
-            matches = re.findall(pattern, objectives_text, re.MULTILINE | re.IGNORECASE)
-            objectives.extend([match.strip() for match in matches if len(match.strip()) > 10])
+        for match in self._objective_re.finditer(objectives_text):
+            objective = next(group for group in match.groups() if group).strip()
+            if len(objective) > 10:
+                objectives.append(objective)
+                if len(objectives) == 5:  # Limit to top 5 objectives
+                    break
         
-        return objectives[:5]  # Limit to top 5 objectives
+        return objectives
 
     def _count_activities(self, activities_text: str) -> int:
         """Count the number of activities in the activities section"""
@@ -225,17 +468,9 @@ class PDFProcessor:
             return 0
         
         # Count numbered activities, bullet points, or activity indicators
-        activity_patterns = [
-            r'(?:^|\n)\s*[\d\-\*•]\s*(?:actividad|ejercicio|tarea)',
-            r'(?:primera|segunda|tercera|cuarta|quinta)\s+(?:actividad|fase)',
-            r'(?:inicio|desarrollo|cierre)\s*:',
-            r'(?:^|\n)\s*(?:paso|etapa)\s+\d+'
-        ]
-        
         total_count = 0
-        for pattern in activity_patterns:
-            matches = re.findall(pattern, activities_text, re.MULTILINE | re.IGNORECASE)
-            total_count += len(matches)
+        for pattern in self._activity_res:
+            total_count += len(pattern.findall(activities_text))
         
         return max(total_count, 1) if activities_text.strip() else 0
 
@@ -246,15 +481,13 @@ class PDFProcessor:
         if not evaluation_text:
             return methods
         
-        assessment_keywords = [
-            'observación', 'rúbrica', 'lista de cotejo', 'portafolio',
-            'examen', 'prueba', 'quiz', 'proyecto', 'presentación',
-            'autoevaluación', 'coevaluación', 'heteroevaluación'
-        ]
+        if self._assessment_automaton is not None:
+            found = {keyword for _, keyword in self._assessment_automaton.iter(evaluation_text.lower())}
+        else:
+            found = {match.group().lower() for match in self._assessment_re.finditer(evaluation_text)}
         
-        text_lower = evaluation_text.lower()
-        for keyword in assessment_keywords:
-            if keyword in text_lower:
+        for keyword in self.assessment_keywords:
+            if keyword in found:
                 methods.append(keyword.title())
         
         return methods
@@ -267,13 +500,8 @@ class PDFProcessor:
             return resources
         
         # Look for resource items
-        resource_patterns = [
-            r'(?:^|\n)\s*[\d\-\*•]\s*(.+?)(?=\n|$)',
-            r'(?:libro|texto|material|recurso|herramienta)\s*:?\s*(.+?)(?=\n|$)'
-        ]
-        
-        for pattern in resource_patterns:
-            matches = re.findall(pattern, resources_text, re.MULTILINE | re.IGNORECASE)
+        for pattern in self._resource_res:
+            matches = pattern.findall(resources_text)
             resources.extend([match.strip() for match in matches if len(match.strip()) > 3])
         
         return resources[:10]  # Limit to top 10 resources
@@ -290,23 +518,12 @@ class PDFProcessor:
             return time_info
         
         # Look for time patterns
-        time_patterns = [
-            r'(\d+)\s*(?:minutos?|min\.?)',
-            r'(\d+)\s*(?:horas?|hr\.?)',
-            r'(\d+)\s*(?:hrs?\.?)'
-        ]
-        
         total_minutes = 0
         activities_with_time = 0
         
-        for pattern in time_patterns:
-            matches = re.findall(pattern, time_text, re.IGNORECASE)
-            for match in matches:
-                minutes = int(match)
-                if 'hora' in pattern or 'hr' in pattern:
-                    minutes *= 60
-                total_minutes += minutes
-                activities_with_time += 1
+        for amount, unit in self._time_re.findall(time_text):
+            total_minutes += int(amount) * _MINUTES_PER_UNIT[unit[0].lower()]
+            activities_with_time += 1
         
         time_info['total_minutes'] = total_minutes
         time_info['activities_with_time'] = activities_with_time
@@ -318,8 +535,9 @@ class PDFProcessor:
         essential_sections = ['objetivos', 'contenidos', 'actividades']
         recommended_sections = ['evaluacion', 'recursos', 'tiempo']
         
-        essential_found = sum(1 for section in essential_sections if section in sections and sections[section].strip())
-        recommended_found = sum(1 for section in recommended_sections if section in sections and sections[section].strip())
+        # _extract_sections only keeps sections with content, so presence is enough
+        essential_found = sum(1 for section in essential_sections if section in sections)
+        recommended_found = sum(1 for section in recommended_sections if section in sections)
         
         # Essential sections worth 70%, recommended worth 30%
         essential_score = (essential_found / len(essential_sections)) * 70
@@ -375,4 +593,11 @@ class PDFProcessor:
         if time_info.get('total_minutes', 0) > 0:
             summary.append(f"Tiempo total estimado: {time_info['total_minutes']} minutos")
         
-        return "\n".join(summary)
\ No newline at end of file
+        return "\n".join(summary)
+
+
+# Compile the class-level patterns once, at import
+PDFProcessor._compile_patterns()
+
+# Stateless, so one instance serves every request
+processor = PDFProcessor()
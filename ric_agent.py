@@ -1,16 +1,91 @@
-import os
-import json
+import copy
+import hashlib
 import logging
-from openai import OpenAI
+import jsonutil
+from openai_client import get_client
+
+# Built once at import; an identical prefix on every request is also what
+# OpenAI prompt caching keys on
+_SYSTEM_PROMPT = """
+Eres RIC (Reflective Instruction Coach), un consultor educativo experto especializado en analizar la entrega de enseñanza y proporcionar retroalimentación práctica a educadores. Tu rol es ayudar a los maestros a mejorar la efectividad de su comunicación en el aula.
+
+ÁREAS DE ANÁLISIS:
+1. Entrega del Discurso y Claridad
+2. Engagement y Ritmo
+3. Comunicación Profesional
+4. Manejo del Aula (señales verbales)
+5. Adecuación al Nivel Educativo
+
+CRITERIOS DE EVALUACIÓN:
+- Velocidad de Habla: Rango óptimo 120-160 PPM para instrucción
+- Uso de Pausas: Uso efectivo para énfasis y comprensión
+- Variedad Vocal: Rango de tono y patrones de entonación
+- Claridad: Mínimas muletillas y articulación clara
+- Control de Volumen: Intensidad y consistencia apropiadas
+- Adecuación al Grado: Lenguaje y conceptos apropiados para la edad
+
+ADECUACIÓN POR NIVEL EDUCATIVO:
+- Primaria temprana (1°-3°): Lenguaje simple, analogías concretas, repetición frecuente
+- Primaria tardía (4°-6°): Vocabulario intermedio, ejemplos prácticos, explicaciones paso a paso
+- Secundaria (7°-9°): Conceptos más abstractos, terminología técnica moderada
+- Preparatoria (10°-12°): Lenguaje académico, conceptos complejos, análisis crítico
+
+RECOMENDACIONES ESPECÍFICAS POR NIVEL:
+- Si el contenido es muy técnico para el grado: "En [momento específico] el lenguaje fue muy técnico. Considera usar analogías como [ejemplo] para que los estudiantes de este grado puedan entender mejor."
+- Si es muy simple para el grado: "El nivel de explicación podría ser más desafiante para estudiantes de este grado."
+- Si las pausas son inadecuadas: "Para estudiantes de este nivel, considera pausas más [largas/cortas] para permitir mejor procesamiento."
+
+FORMATO DE SALIDA (JSON). Puntuaciones de 1 a 100. Cada sección de "detailed_analysis" es {"score", "feedback", "recommendations": ["Sugerencias prácticas"]}:
+{
+  "overall_score", "summary": "Evaluación general breve",
+  "strengths": ["2-3 fortalezas clave"], "areas_for_improvement": ["2-3 áreas específicas de mejora"],
+  "detailed_analysis": {
+    "speech_delivery": velocidad, claridad, articulación,
+    "engagement_pace": ritmo e indicadores de engagement estudiantil,
+    "vocal_variety": variación de tono y entonación,
+    "professional_communication": muletillas, pausas, confianza,
+    "grade_level_appropriateness": adecuación del lenguaje y conceptos al grado
+  },
+  "key_metrics": {
+    "speech_rate_assessment": "muy_lento|lento|optimal|rapido|muy_rapido",
+    "pause_effectiveness": "poor|fair|good|excellent",
+    "filler_word_frequency": "high|moderate|low",
+    "vocal_confidence": "low|moderate|high",
+    "grade_appropriateness": "muy_simple|simple|adecuado|complejo|muy_complejo"
+  },
+  "action_plan": ["3-5 acciones de mejora priorizadas y específicas"],
+  "grade_specific_tips": ["2-3 consejos para enseñar a este grado"]
+}
+
+TONO: Profesional, apoyo, constructivo. Enfócate en el crecimiento y mejoras prácticas. Reconoce fortalezas mientras proporcionas orientación clara y práctica para la mejora.
+
+IMPORTANTE: 
+- Todas las respuestas deben ser en español
+- Considera siempre el contexto educativo proporcionado (materia, grado, tema)
+- Da ejemplos específicos de la transcripción cuando hagas recomendaciones
+- Si detectas lenguaje muy técnico para el grado, sugiere analogías o simplificaciones específicas
+- Si el nivel es muy simple para el grado, sugiere cómo elevar el nivel académico apropiadamente
+"""
+_SYSTEM_MESSAGE = {"role": "system", "content": _SYSTEM_PROMPT}
+# Part of every feedback cache key, so editing the prompt invalidates stored feedback
+_PROMPT_DIGEST = hashlib.blake2b(_SYSTEM_PROMPT.encode(), digest_size=8).hexdigest()
+
+# Long enough for the full feedback JSON; stops runaway generations
+RIC_MAX_TOKENS = 2000
+
 
 class RICAgent:
     """RIC AI Agent - Educational feedback system using GPT-4 Turbo"""
     
     def __init__(self):
         # Using GPT-4-turbo as requested by the user
-        self.client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
         self.model = "gpt-4-turbo"
     
+    @property
+    def client(self):
+        """Shared OpenAI client, so per-request agents reuse warm connections"""
+        return get_client()
+    
     def generate_educational_feedback(self, analysis_data):
         """
         Generate comprehensive educational feedback based on transcription and prosodic analysis
@@ -22,34 +97,23 @@ class RICAgent:
             Dict with structured educational feedback
         """
         try:
-            # Prepare the analysis summary for the AI
-            transcription = analysis_data.get('transcription', {})
-            prosody = analysis_data.get('prosody', {})
-            educational_context = analysis_data.get('educational_context', {})
-            
-            analysis_summary = self._prepare_analysis_summary(transcription, prosody, educational_context)
-            
-            # Generate comprehensive feedback
-            feedback_response = self.client.chat.completions.create(
+            # Generate comprehensive feedback, streamed so long generations
+            # keep the connection active instead of idling until the end
+            stream = self.client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": self._get_system_prompt()
-                    },
-                    {
-                        "role": "user",
-                        "content": f"Analyze this classroom teaching session and provide educational feedback:\n\n{analysis_summary}"
-                    }
-                ],
+                messages=self._build_messages(analysis_data),
                 response_format={"type": "json_object"},
-                temperature=0.7
+                temperature=0.2,
+                max_tokens=RIC_MAX_TOKENS,
+                stream=True
             )
             
-            content = feedback_response.choices[0].message.content
-            if content is None:
+            content, finish_reason = self._collect_stream(stream)
+            if not content:
                 raise Exception("Empty response from AI model")
-            feedback = json.loads(content)
+            if finish_reason == "length":
+                raise Exception("AI response was cut off before completing the feedback")
+            feedback = jsonutil.loads(content)
             
             # Add metadata
             feedback['analysis_timestamp'] = analysis_data.get('timestamp')
@@ -61,6 +125,55 @@ class RICAgent:
             logging.error(f"RIC Agent error: {str(e)}")
             return self._get_error_feedback(str(e))
     
+    def cache_key(self, analysis_data):
+        """
+        Key identifying the feedback for analysis_data
+        
+        Sessions whose summary sent to the model is identical (same context,
+        metrics and transcript excerpt) map to the same key, so callers can
+        persist feedback under it and skip the model on re-uploads.
+        """
+        content = self._build_messages(analysis_data)[-1]["content"]
+        payload = f"{self.model}\0{_PROMPT_DIGEST}\0{content}"
+        return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+    
+    def with_metadata(self, feedback, analysis_data):
+        """Copy stored feedback and stamp it with per-request metadata"""
+        feedback = copy.deepcopy(feedback)
+        feedback['analysis_timestamp'] = analysis_data.get('timestamp')
+        feedback['ric_version'] = '1.0'
+        return feedback
+    
+    def _build_messages(self, analysis_data):
+        """Build the chat messages for a teaching session analysis request"""
+        analysis_summary = self._prepare_analysis_summary(
+            analysis_data.get('transcription', {}),
+            analysis_data.get('prosody', {}),
+            analysis_data.get('educational_context', {})
+        )
+        return [
+            _SYSTEM_MESSAGE,
+            {
+                "role": "user",
+                "content": f"Analyze this classroom teaching session and provide educational feedback:\n\n{analysis_summary}"
+            }
+        ]
+    
+    def _collect_stream(self, stream):
+        """Join the content of a streamed completion, returning (content, finish_reason)"""
+        parts = []
+        finish_reason = None
+        try:
+            for chunk in stream:
+                if chunk.choices:
+                    choice = chunk.choices[0]
+                    if choice.delta.content:
+                        parts.append(choice.delta.content)
+                    finish_reason = choice.finish_reason or finish_reason
+        finally:
+            stream.close()
+        return "".join(parts), finish_reason
+    
     def _prepare_analysis_summary(self, transcription, prosody, educational_context=None):
         """Prepare a summary of the analysis data for the AI"""
         summary = []
@@ -101,88 +214,7 @@ class RICAgent:
     
     def _get_system_prompt(self):
         """Get the system prompt for RIC educational feedback"""
-        return """
-Eres RIC (Reflective Instruction Coach), un consultor educativo experto especializado en analizar la entrega de enseñanza y proporcionar retroalimentación práctica a educadores. Tu rol es ayudar a los maestros a mejorar la efectividad de su comunicación en el aula.
-
-ÁREAS DE ANÁLISIS:
-1. Entrega del Discurso y Claridad
-2. Engagement y Ritmo
-3. Comunicación Profesional
-4. Manejo del Aula (señales verbales)
-5. Adecuación al Nivel Educativo
-
-CRITERIOS DE EVALUACIÓN:
-- Velocidad de Habla: Rango óptimo 120-160 PPM para instrucción
-- Uso de Pausas: Uso efectivo para énfasis y comprensión
-- Variedad Vocal: Rango de tono y patrones de entonación
-- Claridad: Mínimas muletillas y articulación clara
-- Control de Volumen: Intensidad y consistencia apropiadas
-- Adecuación al Grado: Lenguaje y conceptos apropiados para la edad
-
-ADECUACIÓN POR NIVEL EDUCATIVO:
-- Primaria temprana (1°-3°): Lenguaje simple, analogías concretas, repetición frecuente
-- Primaria tardía (4°-6°): Vocabulario intermedio, ejemplos prácticos, explicaciones paso a paso
-- Secundaria (7°-9°): Conceptos más abstractos, terminología técnica moderada
-- Preparatoria (10°-12°): Lenguaje académico, conceptos complejos, análisis crítico
-
-RECOMENDACIONES ESPECÍFICAS POR NIVEL:
-- Si el contenido es muy técnico para el grado: "En [momento específico] el lenguaje fue muy técnico. Considera usar analogías como [ejemplo] para que los estudiantes de este grado puedan entender mejor."
-- Si es muy simple para el grado: "El nivel de explicación podría ser más desafiante para estudiantes de este grado."
-- Si las pausas son inadecuadas: "Para estudiantes de este nivel, considera pausas más [largas/cortas] para permitir mejor procesamiento."
-
-FORMATO DE SALIDA (JSON):
-{
-  "overall_score": 1-100,
-  "summary": "Evaluación general breve en español",
-  "strengths": ["Lista de 2-3 fortalezas clave"],
-  "areas_for_improvement": ["Lista de 2-3 áreas específicas de mejora"],
-  "detailed_analysis": {
-    "speech_delivery": {
-      "score": 1-100,
-      "feedback": "Retroalimentación específica sobre velocidad, claridad, articulación",
-      "recommendations": ["Sugerencias prácticas"]
-    },
-    "engagement_pace": {
-      "score": 1-100,
-      "feedback": "Análisis del ritmo e indicadores de engagement estudiantil",
-      "recommendations": ["Sugerencias prácticas"]
-    },
-    "vocal_variety": {
-      "score": 1-100,
-      "feedback": "Evaluación de variación de tono y entonación",
-      "recommendations": ["Sugerencias prácticas"]
-    },
-    "professional_communication": {
-      "score": 1-100,
-      "feedback": "Evaluación de muletillas, pausas, confianza",
-      "recommendations": ["Sugerencias prácticas"]
-    },
-    "grade_level_appropriateness": {
-      "score": 1-100,
-      "feedback": "Evaluación de la adecuación del lenguaje y conceptos al grado",
-      "recommendations": ["Sugerencias específicas para el nivel educativo"]
-    }
-  },
-  "key_metrics": {
-    "speech_rate_assessment": "muy_lento|lento|optimal|rapido|muy_rapido",
-    "pause_effectiveness": "poor|fair|good|excellent",
-    "filler_word_frequency": "high|moderate|low",
-    "vocal_confidence": "low|moderate|high",
-    "grade_appropriateness": "muy_simple|simple|adecuado|complejo|muy_complejo"
-  },
-  "action_plan": ["3-5 elementos de acción priorizados y específicos para mejora"],
-  "grade_specific_tips": ["2-3 consejos específicos para enseñar a este grado"]
-}
-
-TONO: Profesional, apoyo, constructivo. Enfócate en el crecimiento y mejoras prácticas. Reconoce fortalezas mientras proporcionas orientación clara y práctica para la mejora.
-
-IMPORTANTE: 
-- Todas las respuestas deben ser en español
-- Considera siempre el contexto educativo proporcionado (materia, grado, tema)
-- Da ejemplos específicos de la transcripción cuando hagas recomendaciones
-- Si detectas lenguaje muy técnico para el grado, sugiere analogías o simplificaciones específicas
-- Si el nivel es muy simple para el grado, sugiere cómo elevar el nivel académico apropiadamente
-"""
+        return _SYSTEM_PROMPT
     
     def _get_error_feedback(self, error_message):
         """Return error feedback structure"""
@@ -207,3 +239,7 @@ IMPORTANTE:
             "error": error_message,
             "ric_version": "1.0"
         }
+
+
+# Stateless, so one instance serves every request
+agent = RICAgent()
@@ -1,32 +1,43 @@
 import os
+import re
+import gzip
+import atexit
+import time
 import logging
-from datetime import datetime
-from flask import render_template, request, jsonify, flash, redirect, url_for, send_file
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from flask import render_template, request, jsonify, flash, redirect, url_for, send_file, abort, Response, stream_with_context
 from werkzeug.utils import secure_filename
-from app import app, db
-from models import ClassroomAnalysis, AudioAnalysis  # AudioAnalysis is alias for backward compatibility
-from audio_processor import AudioProcessor
-from ric_agent import RICAgent
-from pdf_processor import PDFProcessor
-from lesson_plan_agent import LessonPlanAgent
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, load_only, undefer_group
+from app import app, db, COMPRESS_LEVEL
+from models import ClassroomAnalysis, AudioAnalysis, BatchJob, FeedbackCache  # AudioAnalysis is alias for backward compatibility
+from audio_processor import processor as audio_processor
+from ric_agent import agent as ric_agent
+from pdf_processor import processor as pdf_processor
+from lesson_plan_agent import agent as lesson_plan_agent, batch_agent, BATCH_TERMINAL_STATUSES
+from cache import TTLCache
+import blob_store
 import json
+import jsonutil
 
 AUDIO_EXTENSIONS = {'mp3', 'wav', 'm4a', 'ogg', 'flac', 'webm'}
 PDF_EXTENSIONS = {'pdf'}
 VIDEO_EXTENSIONS = {'mp4'}
-ALLOWED_EXTENSIONS = AUDIO_EXTENSIONS | PDF_EXTENSIONS | VIDEO_EXTENSIONS
+# File extension (with its dot, lowercased) -> analysis type
+_EXTENSION_KIND = {
+    **{f'.{ext}': 'audio' for ext in AUDIO_EXTENSIONS},
+    **{f'.{ext}': 'pdf' for ext in PDF_EXTENSIONS},
+    **{f'.{ext}': 'video' for ext in VIDEO_EXTENSIONS},
+}
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
-def is_audio_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in AUDIO_EXTENSIONS
-
-def is_pdf_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in PDF_EXTENSIONS
-
-def is_video_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in VIDEO_EXTENSIONS
+def classify_file(filename):
+    """Analysis type for filename ('audio', 'pdf' or 'video'), or None if not allowed"""
+    if not filename:
+        return None
+    return _EXTENSION_KIND.get(os.path.splitext(filename)[1].lower())
 
 
 def get_media_duration(path):
@@ -54,51 +65,143 @@ def upload_choice():
     """Page to choose between audio and PDF analysis"""
     return render_template('upload_choice.html')
 
+def list_columns(*columns):
+    """
+    load_only() for list views
+    
+    ClassroomAnalysis has no relationships, so the N+1 risk on list pages is
+    a lazy load per row for a column left out of the list. In debug mode
+    those raise instead, so a template touching an unlisted column fails
+    loudly during development.
+    """
+    return load_only(*columns, raiseload=app.debug)
+
+
+# The dashboard payload and the upload pages' recent lists only change when an
+# analysis is added or changes state, so they are served from memory for up to
+# SUMMARY_CACHE_TTL seconds and dropped whenever a commit touches
+# ClassroomAnalysis rows. The cache is per process: a commit only clears the
+# worker that made it, so the other gunicorn workers may show counts and lists
+# up to SUMMARY_CACHE_TTL seconds old. Analysis pages read their status
+# uncached. Keys are versioned so a shape change never serves the old one.
+SUMMARY_CACHE_TTL = 30  # seconds
+PROGRESS_CACHE_KEY = 'progress:v2'
+_summary_cache = TTLCache(maxsize=8, ttl=SUMMARY_CACHE_TTL)
+
+
+# Columns shown in the "recent analyses" cards of the upload pages
+RECENT_CARD_COLUMNS = (
+    ClassroomAnalysis.id,
+    ClassroomAnalysis.subject,
+    ClassroomAnalysis.grade_level,
+    ClassroomAnalysis.lesson_topic,
+    ClassroomAnalysis.upload_timestamp
+)
+
+# Columns of the history table; ric_feedback only for its overall score
+HISTORY_COLUMNS = (
+    ClassroomAnalysis.id,
+    ClassroomAnalysis.original_filename,
+    ClassroomAnalysis.analysis_type,
+    ClassroomAnalysis.subject,
+    ClassroomAnalysis.grade_level,
+    ClassroomAnalysis.lesson_topic,
+    ClassroomAnalysis.status,
+    ClassroomAnalysis.upload_timestamp,
+    ClassroomAnalysis.analysis_timestamp,
+    ClassroomAnalysis.ric_feedback
+)
+HISTORY_PAGE_SIZE = 50
+
+# Columns of the dashboard's recent analyses list
+PROGRESS_RECENT_COLUMNS = (
+    ClassroomAnalysis.id,
+    ClassroomAnalysis.original_filename,
+    ClassroomAnalysis.analysis_type,
+    ClassroomAnalysis.subject,
+    ClassroomAnalysis.grade_level,
+    ClassroomAnalysis.status,
+    ClassroomAnalysis.upload_timestamp,
+    ClassroomAnalysis.analysis_timestamp
+)
+
+RECENT_PER_TYPE = 5
+RECENT_CACHE_KEY = 'recent:v1'
+
+
+def is_received():
+    """SQL condition leaving out streamed uploads whose bytes are still arriving"""
+    return ClassroomAnalysis.status != 'receiving'
+
+
+def recent_analyses_by_type():
+    """
+    The latest RECENT_PER_TYPE analyses of each type, as {analysis_type: [row, ...]}
+    
+    One ROW_NUMBER() query serves all three upload pages; rows are plain
+    dicts so the result can be shared through the summary cache.
+    """
+    recent = _summary_cache.get(RECENT_CACHE_KEY)
+    if recent is not None:
+        return recent
+    
+    rank = db.func.row_number().over(
+        partition_by=ClassroomAnalysis.analysis_type,
+        order_by=(ClassroomAnalysis.upload_timestamp.desc(), ClassroomAnalysis.id.desc())
+    ).label('rank')
+    ranked = db.select(ClassroomAnalysis.analysis_type, *RECENT_CARD_COLUMNS, rank).where(is_received()).subquery()
+    rows = db.session.execute(
+        db.select(ranked).where(ranked.c.rank <= RECENT_PER_TYPE).order_by(ranked.c.rank)
+    ).mappings()
+    
+    recent = {}
+    for row in rows:
+        recent.setdefault(row['analysis_type'], []).append(dict(row))
+    _summary_cache.set(RECENT_CACHE_KEY, recent)
+    return recent
+
+
 @app.route('/upload-audio')
 def upload_audio_page():
     """Audio upload page"""
-    recent_analyses = ClassroomAnalysis.query.filter_by(analysis_type='audio').order_by(ClassroomAnalysis.upload_timestamp.desc()).limit(5).all()
+    recent_analyses = recent_analyses_by_type().get('audio', [])
     return render_template('audio_upload.html', recent_analyses=recent_analyses)
 
 
 @app.route('/upload-video')
 def upload_video_page():
     """Video upload page"""
-    recent_analyses = ClassroomAnalysis.query.filter_by(analysis_type='video').order_by(ClassroomAnalysis.upload_timestamp.desc()).limit(5).all()
+    recent_analyses = recent_analyses_by_type().get('video', [])
     return render_template('video_upload.html', recent_analyses=recent_analyses)
 
 @app.route('/upload-pdf')
 def upload_pdf_page():
     """PDF upload page"""
-    recent_analyses = ClassroomAnalysis.query.filter_by(analysis_type='pdf').order_by(ClassroomAnalysis.upload_timestamp.desc()).limit(5).all()
+    recent_analyses = recent_analyses_by_type().get('pdf', [])
     return render_template('pdf_upload.html', recent_analyses=recent_analyses)
 
+# Multipart form field -> analysis type, checked in this order
+UPLOAD_FIELDS = (('audio_file', 'audio'), ('pdf_file', 'pdf'), ('video_file', 'video'))
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     """Handle both audio and PDF file uploads with educational context"""
     try:
-        # Check for either audio or PDF file
+        # Check for an audio, PDF or video file
         file = None
         analysis_type = None
+        for field, field_type in UPLOAD_FIELDS:
+            candidate = request.files.get(field)
+            if candidate and candidate.filename:
+                file, analysis_type = candidate, field_type
+                break
         
-        if 'audio_file' in request.files and request.files['audio_file'].filename:
-            file = request.files['audio_file']
-            analysis_type = 'audio'
-        elif 'pdf_file' in request.files and request.files['pdf_file'].filename:
-            file = request.files['pdf_file']
-            analysis_type = 'pdf'
-        elif 'video_file' in request.files and request.files['video_file'].filename:
-            file = request.files['video_file']
-            analysis_type = 'video'
-        
-        if not file or not analysis_type:
-            flash('No file selected', 'error')
-            return redirect(url_for('index'))
-        if file.filename == '':
+        if file is None:
             flash('No file selected', 'error')
             return redirect(url_for('index'))
         
-        if file.filename is None or not allowed_file(file.filename):
+        original_filename = file.filename
+        if classify_file(original_filename) is None:
             if analysis_type == 'audio':
                 flash('Formato inválido. Sube MP3, WAV, M4A, OGG o FLAC.', 'error')
             elif analysis_type == 'video':
@@ -108,53 +211,21 @@ def upload_file():
             return redirect(url_for('index'))
         
         # Save the file
-        if file.filename is None:
-            flash('Invalid filename', 'error')
-            return redirect(url_for('index'))
-        
-        filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{timestamp}_{filename}"
+        filename = f"{time.strftime('%Y%m%d_%H%M%S')}_{secure_filename(original_filename)}"
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         file.save(filepath)
         # If video, validate duration (max 15 minutes) and optionally extract audio later
-        if analysis_type == 'video':
-            duration = get_media_duration(filepath)
-            max_seconds = 15 * 60
-            if duration is not None and duration > max_seconds:
-                try:
-                    os.remove(filepath)
-                except:
-                    pass
-                flash('El video excede la duración máxima permitida de 15 minutos.', 'error')
-                return redirect(url_for('upload_video_page'))
-        
-        # Get educational context from form
-        subject = request.form.get('subject', '').strip()
-        grade_level = request.form.get('grade_level', '').strip()
-        lesson_topic = request.form.get('lesson_topic', '').strip()
-        additional_context = request.form.get('additional_context', '').strip()
+        if analysis_type == 'video' and remove_if_video_too_long(filepath):
+            flash('El video excede la duración máxima permitida de 15 minutos.', 'error')
+            return redirect(url_for('upload_video_page'))
         
         # Create database record
         analysis = ClassroomAnalysis()
         analysis.filename = filename
-        analysis.original_filename = file.filename
+        analysis.original_filename = original_filename
         analysis.analysis_type = analysis_type
-        analysis.subject = subject
-        analysis.grade_level = grade_level
-        analysis.lesson_topic = lesson_topic
-        analysis.additional_context = additional_context
         analysis.status = 'uploaded'
-        
-        # Add PDF-specific context if applicable
-        if analysis_type == 'pdf':
-            lesson_duration = request.form.get('lesson_duration', '').strip()
-            student_count = request.form.get('student_count', '').strip()
-            learning_objectives = request.form.get('learning_objectives', '').strip()
-            
-            analysis.lesson_duration = int(lesson_duration) if lesson_duration.isdigit() else None
-            analysis.student_count = int(student_count) if student_count.isdigit() else None
-            analysis.learning_objectives = learning_objectives
+        apply_educational_context(analysis, request.form)
         
         db.session.add(analysis)
         db.session.commit()
@@ -173,13 +244,172 @@ def upload_file():
         flash('Error uploading file. Please try again.', 'error')
         return redirect(url_for('index'))
 
-@app.route('/analyze/<int:analysis_id>')
-def analyze(analysis_id):
-    """Display analysis page and trigger processing for both audio and PDF"""
-    analysis = ClassroomAnalysis.query.get_or_404(analysis_id)
+# Analyses run on a background pool so the request that starts one returns
+# right away instead of holding a worker thread for the whole transcription /
+# LLM pipeline; the analysis pages reload until the status changes
+ANALYSIS_WORKERS = int(os.environ.get("ANALYSIS_WORKERS", "4"))
+_analysis_executor = ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix="analysis")
+# Prosody runs alongside the Whisper call; a pool of its own, since waiting
+# on the analysis pool from an analysis job could deadlock it
+_prosody_executor = ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix="prosody")
+
+
+# A job lost with its worker (restart, redeploy, SIGKILL) would leave its row in
+# 'processing' forever, so analyses running for longer than this are failed
+# when next looked at (fail_stale_analyses). Jobs still waiting for a free
+# worker get ANALYSIS_QUEUE_STALE_SECONDS instead, which also covers a lesson
+# plan batch waiting out the Batch API's 24h completion window.
+ANALYSIS_STALE_SECONDS = int(os.environ.get("ANALYSIS_STALE_SECONDS", 30 * 60))
+ANALYSIS_QUEUE_STALE_SECONDS = int(os.environ.get("ANALYSIS_QUEUE_STALE_SECONDS", 25 * 60 * 60))
+STALE_ANALYSIS_ERROR = 'El análisis se interrumpió antes de terminar. Vuelve a subir el archivo.'
+# Jobs submitted to this worker's pool and not yet finished, by analysis id;
+# the ones that never started are handed back at exit
+_queued_analyses = {}
+
+
+def claim_analysis(analysis_id):
+    """Atomically move an uploaded analysis to 'processing'; True if this call claimed it"""
+    # The conditional update lets only one request claim the row, so a page
+    # refresh (or a second worker) can't start the same analysis twice
+    claimed = ClassroomAnalysis.query.filter_by(id=analysis_id, status='uploaded').update(
+        {'status': 'processing', 'queued_at': db.func.now(), 'processing_started_at': None},
+        synchronize_session=False
+    )
+    # A bulk UPDATE bypasses the flush, so flag the change by hand
+    db.session.info['analyses_changed'] = True
+    db.session.commit()
+    return bool(claimed)
+
+
+def start_analysis(analysis):
+    """Claim an uploaded analysis and queue its processing in the background"""
+    analysis_id = analysis.id
+    if claim_analysis(analysis_id):
+        future = _analysis_executor.submit(run_analysis, analysis_id)
+        _queued_analyses[analysis_id] = future
+        future.add_done_callback(lambda _: _queued_analyses.pop(analysis_id, None))
+
+
+def begin_analysis(analysis_id):
+    """
+    Record that a claimed analysis starts running now; False if it should not run
+    
+    The row may have been failed as stale or handed back while it waited,
+    or already started by another queue entry for it.
+    """
+    started = ClassroomAnalysis.query.filter_by(
+        id=analysis_id, status='processing', processing_started_at=None
+    ).update({'processing_started_at': db.func.now()}, synchronize_session=False)
+    db.session.commit()
+    return bool(started)
+
+
+def save_completed_analysis(analysis):
+    """
+    Commit the analysis' results and mark it completed, in one transaction
+    
+    The status change is a conditional UPDATE, so a row failed as stale while
+    the job ran keeps the error its page already showed; the results are
+    discarded and False is returned.
+    """
+    db.session.flush()
+    finished = ClassroomAnalysis.query.filter_by(id=analysis.id, status='processing').update(
+        {'status': 'completed', 'analysis_timestamp': db.func.now()}, synchronize_session=False
+    )
+    if not finished:
+        db.session.rollback()
+        logging.warning(f"Discarding results for {analysis.filename}: it is no longer processing")
+        return False
+    db.session.info['analyses_changed'] = True
+    db.session.commit()
+    return True
+
+
+def fail_stale_analyses(analysis_id=None):
+    """Mark analyses stuck in 'processing' past their stale cutoff as failed; returns how many"""
+    now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(seconds=ANALYSIS_STALE_SECONDS)
+    queue_cutoff = now - timedelta(seconds=ANALYSIS_QUEUE_STALE_SECONDS)
+    query = ClassroomAnalysis.query.filter(ClassroomAnalysis.status == 'processing', is_stale(cutoff, queue_cutoff))
+    if analysis_id is not None:
+        query = query.filter(ClassroomAnalysis.id == analysis_id)
+    failed = query.update(
+        {'status': 'error', 'error_message': STALE_ANALYSIS_ERROR}, synchronize_session=False
+    )
+    if failed:
+        logging.warning(f"Marked {failed} interrupted analyses as failed")
+        db.session.info['analyses_changed'] = True
+        db.session.commit()
+    return failed
+
+
+def is_stale(cutoff, queue_cutoff):
+    """
+    SQL condition: the analysis started running before cutoff, or has waited
+    to start since before queue_cutoff
     
-    # If not yet processed, start appropriate processing
-    if analysis.status == 'uploaded':
+    Rows claimed before queued_at was recorded count from their upload.
+    """
+    queued = db.func.coalesce(ClassroomAnalysis.queued_at, ClassroomAnalysis.upload_timestamp)
+    return db.or_(
+        ClassroomAnalysis.processing_started_at < cutoff,
+        db.and_(ClassroomAnalysis.processing_started_at.is_(None), queued < queue_cutoff)
+    )
+
+
+def requeue_analyses(analysis_ids):
+    """Hand claimed analyses that are still processing back to 'uploaded'"""
+    ClassroomAnalysis.query.filter(
+        ClassroomAnalysis.id.in_(analysis_ids), ClassroomAnalysis.status == 'processing'
+    ).update({'status': 'uploaded', 'queued_at': None, 'processing_started_at': None}, synchronize_session=False)
+    db.session.info['analyses_changed'] = True
+    db.session.commit()
+
+
+# Jobs lost with a restarted worker are failed by a periodic sweep in every
+# worker, so the dashboard stops counting them as processing without its GET
+# writing to the table. An analysis page still checks its own row on load.
+STALE_SWEEP_INTERVAL = 5 * 60  # seconds
+
+
+def _sweep_stale_analyses():
+    """Fail stale analyses every STALE_SWEEP_INTERVAL seconds, off the request path"""
+    while True:
+        time.sleep(STALE_SWEEP_INTERVAL)
+        try:
+            with app.app_context():
+                fail_stale_analyses()
+        except Exception as e:
+            logging.error(f"Stale analysis sweep failed: {str(e)}")
+
+
+threading.Thread(target=_sweep_stale_analyses, name="stale-sweep", daemon=True).start()
+
+
+@atexit.register
+def _shutdown_analysis_pools():
+    """Stop the pools on worker exit, handing queued analyses back to 'uploaded'"""
+    requeued = [analysis_id for analysis_id, future in list(_queued_analyses.items()) if future.cancel()]
+    _analysis_executor.shutdown(wait=False, cancel_futures=True)
+    _prosody_executor.shutdown(wait=False, cancel_futures=True)
+    if not requeued:
+        return
+    # Re-opened analysis pages start them again through start_analysis()
+    try:
+        with app.app_context():
+            requeue_analyses(requeued)
+    except Exception as e:
+        logging.error(f"Could not requeue analyses {requeued} on shutdown: {str(e)}")
+
+
+def run_analysis(analysis_id):
+    """Process an analysis on a background thread with its own app context and session"""
+    with app.app_context():
+        if not begin_analysis(analysis_id):
+            return
+        analysis = db.session.get(ClassroomAnalysis, analysis_id)
+        if analysis is None:
+            return
         try:
             if analysis.is_audio_analysis():
                 process_audio_analysis(analysis)
@@ -188,10 +418,173 @@ def analyze(analysis_id):
             elif analysis.is_pdf_analysis():
                 process_pdf_analysis(analysis)
         except Exception as e:
-            logging.error(f"Analysis error: {str(e)}")
-            analysis.status = 'error'
-            analysis.error_message = str(e)
-            db.session.commit()
+            logging.error(f"Processing error for {analysis.filename}: {str(e)}")
+            mark_analysis_failed(analysis, e)
+
+
+def mark_analysis_failed(analysis, error):
+    """Discard the analysis' unsaved partial results and record the error in one commit"""
+    db.session.rollback()
+    analysis.status = 'error'
+    analysis.error_message = str(error)
+    db.session.commit()
+
+
+MAX_VIDEO_SECONDS = 15 * 60
+
+
+def remove_if_video_too_long(filepath):
+    """Delete a video longer than MAX_VIDEO_SECONDS, returning True if it was removed"""
+    duration = get_media_duration(filepath)
+    if duration is None or duration <= MAX_VIDEO_SECONDS:
+        return False
+    try:
+        os.remove(filepath)
+    except:
+        pass
+    return True
+
+
+def apply_educational_context(analysis, fields):
+    """Copy the educational context from submitted form (or JSON) fields onto analysis"""
+    def field(name):
+        return str(fields.get(name) or '').strip()
+    
+    analysis.subject = field('subject')
+    analysis.grade_level = field('grade_level')
+    analysis.lesson_topic = field('lesson_topic')
+    analysis.additional_context = field('additional_context')
+    
+    # Add PDF-specific context if applicable
+    if analysis.analysis_type == 'pdf':
+        lesson_duration = field('lesson_duration')
+        student_count = field('student_count')
+        analysis.lesson_duration = int(lesson_duration) if lesson_duration.isdigit() else None
+        analysis.student_count = int(student_count) if student_count.isdigit() else None
+        analysis.learning_objectives = field('learning_objectives')
+
+
+# Streamed uploads: POST /api/uploads registers the file and its context, then
+# the raw bytes are PUT to /upload-stream/<id> and written to disk in chunks,
+# with no multipart parsing or temp-file spooling. Large recordings can be sent
+# in pieces with Content-Range headers, resuming after a dropped connection.
+STREAM_CHUNK_SIZE = 1 << 20  # 1 MiB
+STREAM_UPLOAD_MAX_BYTES = int(os.environ.get("STREAM_UPLOAD_MAX_BYTES", 1024 * 1024 * 1024))  # 1GB
+_CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+
+
+@app.route('/api/uploads', methods=['POST'])
+def create_stream_upload():
+    """Register a streamed upload, returning the URL its bytes are PUT to"""
+    fields = request.get_json(silent=True) or {}
+    original_filename = str(fields.get('filename') or '').strip()
+    
+    analysis_type = classify_file(original_filename)
+    if analysis_type is None:
+        return jsonify({'error': 'Formato inválido. Sube audio, video MP4 o PDF.'}), 400
+    
+    analysis = ClassroomAnalysis()
+    analysis.filename = ''
+    analysis.original_filename = original_filename
+    analysis.analysis_type = analysis_type
+    analysis.status = 'receiving'
+    apply_educational_context(analysis, fields)
+    db.session.add(analysis)
+    db.session.flush()
+    
+    # Each streamed upload gets its own directory, UPLOAD_FOLDER/<id>/
+    safe_name = secure_filename(original_filename) or f"upload{os.path.splitext(original_filename)[1].lower()}"
+    analysis.filename = f"{analysis.id}/{safe_name}"
+    db.session.commit()
+    
+    return jsonify({
+        'analysis_id': analysis.id,
+        'upload_url': url_for('upload_stream', analysis_id=analysis.id)
+    }), 201
+
+
+@app.route('/upload-stream/<int:analysis_id>', methods=['PUT'])
+def upload_stream(analysis_id):
+    """Write a raw (application/octet-stream) upload body, or one Content-Range piece of it, to disk"""
+    analysis = db.get_or_404(ClassroomAnalysis, analysis_id)
+    if analysis.status != 'receiving':
+        return jsonify({'error': 'El archivo de este análisis ya fue recibido'}), 409
+    
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], analysis.filename)
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    received = os.path.getsize(filepath) if os.path.exists(filepath) else 0
+    
+    # Without Content-Range the body is the whole file; with it, the piece
+    # must start where the stored bytes end and carry exactly end - start + 1 bytes
+    start, end, total = 0, None, None
+    content_range = request.headers.get('Content-Range')
+    if content_range:
+        match = _CONTENT_RANGE.fullmatch(content_range.strip())
+        if match is None:
+            return jsonify({'error': 'Content-Range inválido'}), 400
+        start, end = int(match.group(1)), int(match.group(2))
+        total = None if match.group(3) == '*' else int(match.group(3))
+        if end < start:
+            return jsonify({'error': 'Content-Range inválido'}), 400
+        if start != received or (total is not None and end >= total):
+            return jsonify({'error': 'Rango fuera de secuencia', 'received': received}), 416
+    if (total is not None and total > STREAM_UPLOAD_MAX_BYTES) or (end is not None and end >= STREAM_UPLOAD_MAX_BYTES):
+        return jsonify({'error': 'Archivo demasiado grande'}), 413
+    
+    request.max_content_length = STREAM_UPLOAD_MAX_BYTES
+    expected = end - start + 1 if end is not None else STREAM_UPLOAD_MAX_BYTES
+    written = 0
+    with open(filepath, 'ab' if start else 'wb') as out:
+        while written < expected:
+            chunk = request.stream.read(min(STREAM_CHUNK_SIZE, expected - written))
+            if not chunk:
+                break
+            out.write(chunk)
+            written += len(chunk)
+        
+        # Bytes past the declared range (or the size limit) reject the whole
+        # piece; dropping what was written keeps the resume offset at start
+        overflow = written == expected and request.stream.read(1)
+        if overflow and end is None:
+            out.truncate(start)
+            return jsonify({'error': 'Archivo demasiado grande'}), 413
+        if overflow or (end is not None and written != expected):
+            out.truncate(start)
+            return jsonify({'error': 'El cuerpo no coincide con Content-Range', 'received': start}), 400
+    received = start + written
+    
+    # A piece of unknown total (bytes a-b/*) is never the last one
+    if content_range and (total is None or received < total):
+        return jsonify({'analysis_id': analysis.id, 'received': received}), 202
+    
+    if analysis.is_video_analysis() and remove_if_video_too_long(filepath):
+        analysis.status = 'error'
+        analysis.error_message = 'El video excede la duración máxima permitida de 15 minutos.'
+        db.session.commit()
+        return jsonify({'error': analysis.error_message}), 400
+    
+    analysis.status = 'uploaded'
+    db.session.commit()
+    
+    return jsonify({
+        'analysis_id': analysis.id,
+        'received': received,
+        'analyze_url': url_for('analyze', analysis_id=analysis.id)
+    }), 201
+
+
+@app.route('/analyze/<int:analysis_id>')
+def analyze(analysis_id):
+    """Display analysis page and trigger processing for both audio and PDF"""
+    analysis = db.get_or_404(ClassroomAnalysis, analysis_id)
+    
+    # If not yet processed, start appropriate processing; a job lost with its
+    # worker is reported as failed instead of spinning forever. PDF pages run
+    # their analysis themselves over the feedback stream.
+    if analysis.status == 'uploaded' and not analysis.is_pdf_analysis():
+        start_analysis(analysis)
+    elif analysis.status == 'processing':
+        fail_stale_analyses(analysis.id)
     
     # Use appropriate template based on analysis type
     if analysis.is_pdf_analysis():
@@ -214,140 +607,316 @@ def extract_audio_from_video(video_path, out_audio_path):
 
 def process_video_analysis(analysis):
     """Process video file by extracting audio, transcribing and analyzing prosody"""
-    try:
-        analysis.status = 'processing'
-        db.session.commit()
+    video_path = os.path.join(app.config['UPLOAD_FOLDER'], analysis.filename)
 
-        video_path = os.path.join(app.config['UPLOAD_FOLDER'], analysis.filename)
+    # Prepare temp audio path
+    base, _ = os.path.splitext(analysis.filename)
+    audio_filename = f"{base}_extracted.wav"
+    audio_path = os.path.join(app.config['UPLOAD_FOLDER'], audio_filename)
 
-        # Prepare temp audio path
-        base, _ = os.path.splitext(analysis.filename)
-        audio_filename = f"{base}_extracted.wav"
-        audio_path = os.path.join(app.config['UPLOAD_FOLDER'], audio_filename)
+    logging.info(f"Extracting audio from video {analysis.filename}")
 
-        logging.info(f"Extracting audio from video {analysis.filename}")
+    extracted = extract_audio_from_video(video_path, audio_path)
+    if not extracted:
+        raise Exception('No se pudo extraer el audio del video. Asegúrese de que ffmpeg esté instalado.')
 
-        extracted = extract_audio_from_video(video_path, audio_path)
-        if not extracted:
-            raise Exception('No se pudo extraer el audio del video. Asegúrese de que ffmpeg esté instalado.')
+    logging.info(f"Starting transcription and prosodic analysis for extracted audio {audio_filename}")
+    transcription_result, prosody_result = transcribe_and_analyze_prosody(audio_path)
+    analysis.transcription_text = transcription_result['text']
+    analysis.transcription_data = transcription_result
+    analysis.prosody_data = prosody_result
 
-        # Use existing audio processing flow
-        audio_processor = AudioProcessor()
-        ric_agent = RICAgent()
+    logging.info(f"Starting RIC feedback generation for video {analysis.filename}")
+    educational_context = analysis.educational_context
+    combined_data = {
+        'transcription': transcription_result,
+        'prosody': prosody_result,
+        'educational_context': educational_context,
+        'timestamp': datetime.now(timezone.utc).isoformat()
+    }
 
-        logging.info(f"Starting transcription for extracted audio {audio_filename}")
-        transcription_result = audio_processor.transcribe_audio(audio_path)
-        analysis.transcription_text = transcription_result['text']
-        analysis.set_transcription_data(transcription_result)
-        db.session.commit()
+    feedback, cache_key = generate_ric_feedback(combined_data)
+    analysis.ric_feedback = feedback
 
-        logging.info(f"Starting prosodic analysis for extracted audio {audio_filename}")
-        prosody_result = audio_processor.analyze_prosody(audio_path)
-        analysis.set_prosody_data(prosody_result)
-        db.session.commit()
+    # Mark as completed, saving every result in one commit
+    if save_completed_analysis(analysis) and cache_key is not None:
+        store_cached_feedback(cache_key, feedback)
 
-        logging.info(f"Starting RIC feedback generation for video {analysis.filename}")
-        educational_context = analysis.get_educational_context()
-        combined_data = {
-            'transcription': transcription_result,
-            'prosody': prosody_result,
-            'educational_context': educational_context,
-            'timestamp': datetime.utcnow().isoformat()
-        }
+    # cleanup extracted audio
+    try:
+        if os.path.exists(audio_path):
+            os.remove(audio_path)
+    except:
+        pass
 
-        feedback = ric_agent.generate_educational_feedback(combined_data)
-        analysis.set_ric_feedback(feedback)
+    logging.info(f"Video analysis completed for {analysis.filename}")
 
-        # Mark as completed
-        analysis.status = 'completed'
-        analysis.analysis_timestamp = datetime.utcnow()
-        db.session.commit()
+@app.route('/api/analysis/<int:analysis_id>/status')
+def get_analysis_status(analysis_id):
+    """Get current analysis status via API"""
+    status = fetch_analysis_status(analysis_id)
+    if status is None:
+        abort(404)
+    return jsonify(status)
 
-        # cleanup extracted audio
-        try:
-            if os.path.exists(audio_path):
-                os.remove(audio_path)
-        except:
-            pass
 
-        logging.info(f"Video analysis completed for {analysis.filename}")
+def fetch_analysis_status(analysis_id):
+    """Status fields of an analysis as a dict (a plain three-column SELECT), or None"""
+    now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(seconds=ANALYSIS_STALE_SECONDS)
+    queue_cutoff = now - timedelta(seconds=ANALYSIS_QUEUE_STALE_SECONDS)
+    row = db.session.execute(
+        db.select(
+            ClassroomAnalysis.status,
+            ClassroomAnalysis.error_message,
+            ClassroomAnalysis.analysis_type,
+            is_stale(cutoff, queue_cutoff).label('stale')
+        ).where(ClassroomAnalysis.id == analysis_id)
+    ).one_or_none()
+    if row is None:
+        return None
+    if row.status == 'processing' and row.stale and fail_stale_analyses(analysis_id):
+        return {'status': 'error', 'error_message': STALE_ANALYSIS_ERROR, 'analysis_type': row.analysis_type}
+    return {'status': row.status, 'error_message': row.error_message, 'analysis_type': row.analysis_type}
 
-    except Exception as e:
-        logging.error(f"Video processing error for {analysis.filename}: {str(e)}")
-        analysis.status = 'error'
-        analysis.error_message = str(e)
-        db.session.commit()
-        raise e
 
-@app.route('/api/analysis/<int:analysis_id>/status')
-def get_analysis_status(analysis_id):
-    """Get current analysis status via API"""
-    analysis = ClassroomAnalysis.query.get_or_404(analysis_id)
-    return jsonify({
-        'status': analysis.status,
-        'error_message': analysis.error_message,
-        'analysis_type': analysis.analysis_type
-    })
+# Analysis pages follow a running analysis over Server-Sent Events. Under the
+# gthread worker every open stream holds a request thread, so a stream only
+# lives for STATUS_STREAM_WINDOW seconds: it checks the status every
+# STATUS_RECHECK_INTERVAL seconds (a primary-key SELECT, the same in whichever
+# worker runs the job), then ends, and EventSource reconnects after
+# STATUS_RECONNECT_MS. A tab watching an analysis therefore ties up a thread
+# for at most the window, not for the whole analysis.
+STATUS_RECHECK_INTERVAL = 3  # seconds
+STATUS_STREAM_WINDOW = 30  # seconds
+STATUS_RECONNECT_MS = 2000
+FINAL_STATUSES = ('completed', 'error')
+
+
+@app.route('/api/analysis/<int:analysis_id>/events')
+def stream_analysis_status(analysis_id):
+    """Push the status of an analysis as Server-Sent Events for a short window"""
+    status = fetch_analysis_status(analysis_id)
+    if status is None:
+        abort(404)
+    
+    def events():
+        current = status
+        sent = None
+        deadline = time.monotonic() + STATUS_STREAM_WINDOW
+        yield f"retry: {STATUS_RECONNECT_MS}\n\n"
+        while True:
+            # Release the pooled connection between checks
+            db.session.rollback()
+            if current != sent:
+                yield f"event: status\ndata: {jsonutil.dumps(current)}\n\n"
+                sent = current
+            else:
+                yield ": keep-alive\n\n"
+            if current['status'] in FINAL_STATUSES or time.monotonic() >= deadline:
+                return
+            
+            time.sleep(STATUS_RECHECK_INTERVAL)
+            current = fetch_analysis_status(analysis_id)
+            if current is None:
+                return
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @app.route('/api/analysis/<int:analysis_id>/results')
 def get_analysis_results(analysis_id):
     """Get analysis results via API for both audio and PDF"""
-    analysis = ClassroomAnalysis.query.get_or_404(analysis_id)
+    analysis = db.one_or_404(
+        db.select(ClassroomAnalysis).options(undefer_group('payload')).where(ClassroomAnalysis.id == analysis_id)
+    )
     
     if analysis.status != 'completed':
         return jsonify({'error': 'Analysis not completed'}), 400
     
     results = {
         'analysis_type': analysis.analysis_type,
-        'feedback': analysis.get_ric_feedback()
+        'feedback': analysis.ric_feedback
     }
     
     if analysis.is_audio_analysis() or analysis.is_video_analysis():
         results.update({
-            'transcription': analysis.get_transcription_data(),
-            'prosody': analysis.get_prosody_data()
+            'transcription': analysis.transcription_data,
+            'prosody': analysis.prosody_data
         })
     elif analysis.is_pdf_analysis():
         results.update({
-            'lesson_structure': analysis.get_lesson_plan_structure(),
-            'pedagogical_analysis': analysis.get_pedagogical_analysis()
+            'lesson_structure': analysis.lesson_plan_structure,
+            'pedagogical_analysis': analysis.pedagogical_analysis
         })
     
     return jsonify(results)
 
 @app.route('/history')
 def history():
-    """View analysis history for both audio and PDF"""
-    analyses = ClassroomAnalysis.query.order_by(ClassroomAnalysis.upload_timestamp.desc()).all()
-    return render_template('history.html', analyses=analyses)
+    """View analysis history for both audio and PDF, one page at a time"""
+    page = request.args.get('page', 1, type=int)
+    pagination = ClassroomAnalysis.query.options(
+        list_columns(*HISTORY_COLUMNS)
+    ).filter(is_received()).order_by(
+        ClassroomAnalysis.upload_timestamp.desc(), ClassroomAnalysis.id.desc()
+    ).paginate(page=page, per_page=HISTORY_PAGE_SIZE, error_out=False)
+    
+    # The summary cards count every analysis, not just the ones on this page
+    stats = db.session.query(
+        count_where(ClassroomAnalysis.status == 'completed').label('completed'),
+        count_where(ClassroomAnalysis.status == 'processing').label('processing'),
+        count_where(ClassroomAnalysis.status == 'error').label('error')
+    ).one()
+    return render_template('history.html', analyses=pagination.items, pagination=pagination, stats=stats)
+
+
+@app.route('/api/history')
+def history_feed():
+    """
+    Keyset-paginated history for infinite scroll
+    
+    Pass the returned next_cursor as ?cursor= to get the following page;
+    unlike OFFSET, deep pages cost the same as the first one.
+    """
+    limit = max(1, min(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), HISTORY_PAGE_SIZE))
+    query = ClassroomAnalysis.query.options(list_columns(*HISTORY_COLUMNS)).filter(is_received())
+    
+    # The cursor is the id of the last row served. Its timestamp is compared
+    # as stored, via a subquery: SQLite keeps CURRENT_TIMESTAMP without the
+    # microseconds a bound datetime is rendered with, so comparing against a
+    # timestamp parsed from the cursor would repeat that row on the next page.
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            last_id = int(cursor)
+        except ValueError:
+            return jsonify({'error': 'Cursor inválido'}), 400
+        last_timestamp = db.select(ClassroomAnalysis.upload_timestamp).where(
+            ClassroomAnalysis.id == last_id
+        ).scalar_subquery()
+        query = query.filter(db.or_(
+            ClassroomAnalysis.upload_timestamp < last_timestamp,
+            db.and_(ClassroomAnalysis.upload_timestamp == last_timestamp, ClassroomAnalysis.id < last_id)
+        ))
+    
+    analyses = query.order_by(
+        ClassroomAnalysis.upload_timestamp.desc(), ClassroomAnalysis.id.desc()
+    ).limit(limit).all()
+    
+    items = [{
+        'id': analysis.id,
+        'filename': analysis.original_filename,
+        'type': analysis.analysis_type,
+        'subject': analysis.subject,
+        'grade': analysis.grade_level,
+        'lesson_topic': analysis.lesson_topic,
+        'status': analysis.status,
+        'upload_time': analysis.upload_timestamp.isoformat(),
+        'analysis_time': analysis.analysis_timestamp.isoformat() if analysis.analysis_timestamp else None,
+        'overall_score': (analysis.ric_feedback or {}).get('overall_score')
+    } for analysis in analyses]
+    
+    next_cursor = None
+    if len(analyses) == limit:
+        next_cursor = str(analyses[-1].id)
+    return jsonify({'items': items, 'next_cursor': next_cursor})
 
 @app.route('/dashboard')
 def dashboard():
     """Show progress dashboard with analytics"""
     return render_template('dashboard.html')
 
+
+@event.listens_for(Session, 'after_flush')
+def _flag_analysis_change(session, flush_context):
+    if any(isinstance(obj, ClassroomAnalysis) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info['analyses_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_summaries(session):
+    if session.info.pop('analyses_changed', False):
+        _summary_cache.clear()
+
+
+def count_where(condition):
+    """COUNT of the rows matching condition, for combining several counts in one query"""
+    return db.func.count(db.case((condition, 1)))
+
+
+def seconds_between(start, end):
+    """SQL expression for the seconds elapsed from start to end"""
+    if db.engine.dialect.name == 'postgresql':
+        return db.func.extract('epoch', end - start)
+    # SQLite stores timestamps as text; julianday() parses them into days
+    return (db.func.julianday(end) - db.func.julianday(start)) * 86400
+
+
+def cached_json_response(entry):
+    """
+    Response for a cached (payload, gzipped payload) pair
+    
+    The body is compressed once when cached rather than by the
+    compress_response hook on every hit.
+    """
+    payload, compressed = entry
+    if 'gzip' in request.accept_encodings:
+        response = Response(compressed, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(payload, mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    return response
+
+
 @app.route('/api/progress')
 def get_progress_data():
     """Get comprehensive progress analytics"""
+    cached = _summary_cache.get(PROGRESS_CACHE_KEY)
+    if cached is not None:
+        return cached_json_response(cached)
+    
     try:
-        # Basic counts
-        total_analyses = ClassroomAnalysis.query.count()
-        audio_analyses = ClassroomAnalysis.query.filter_by(analysis_type='audio').count()
-        pdf_analyses = ClassroomAnalysis.query.filter_by(analysis_type='pdf').count()
-        video_analyses = ClassroomAnalysis.query.filter_by(analysis_type='video').count()
-        
-        # Status distribution
-        completed_analyses = ClassroomAnalysis.query.filter_by(status='completed').count()
-        processing_analyses = ClassroomAnalysis.query.filter_by(status='processing').count()
-        error_analyses = ClassroomAnalysis.query.filter_by(status='error').count()
-        uploaded_analyses = ClassroomAnalysis.query.filter_by(status='uploaded').count()
+        # Basic counts, status distribution and average processing time, in a
+        # single pass over the table
+        counts = db.session.query(
+            db.func.count().label('total'),
+            count_where(ClassroomAnalysis.analysis_type == 'audio').label('audio'),
+            count_where(ClassroomAnalysis.analysis_type == 'pdf').label('pdf'),
+            count_where(ClassroomAnalysis.analysis_type == 'video').label('video'),
+            count_where(ClassroomAnalysis.status == 'completed').label('completed'),
+            count_where(ClassroomAnalysis.status == 'processing').label('processing'),
+            count_where(ClassroomAnalysis.status == 'error').label('error'),
+            count_where(ClassroomAnalysis.status == 'uploaded').label('uploaded'),
+            # AVG skips the NULLs the CASE yields for unfinished rows
+            db.func.avg(db.case((
+                db.and_(
+                    ClassroomAnalysis.status == 'completed',
+                    ClassroomAnalysis.analysis_timestamp.isnot(None)
+                ),
+                seconds_between(ClassroomAnalysis.upload_timestamp, ClassroomAnalysis.analysis_timestamp)
+            ))).label('avg_processing_seconds')
+        ).filter(is_received()).one()
+        total_analyses = counts.total
+        audio_analyses = counts.audio
+        pdf_analyses = counts.pdf
+        video_analyses = counts.video
+        completed_analyses = counts.completed
+        processing_analyses = counts.processing
+        error_analyses = counts.error
+        uploaded_analyses = counts.uploaded
+        avg_processing_time = float(counts.avg_processing_seconds or 0)
         
         # Subject distribution (top 10)
         subject_stats = db.session.query(
             ClassroomAnalysis.subject, 
             db.func.count(ClassroomAnalysis.id).label('count')
         ).filter(
-            ClassroomAnalysis.subject.isnot(None)
+            ClassroomAnalysis.subject.isnot(None), is_received()
         ).group_by(ClassroomAnalysis.subject).order_by(
             db.func.count(ClassroomAnalysis.id).desc()
         ).limit(10).all()
@@ -357,19 +926,18 @@ def get_progress_data():
             ClassroomAnalysis.grade_level, 
             db.func.count(ClassroomAnalysis.id).label('count')
         ).filter(
-            ClassroomAnalysis.grade_level.isnot(None)
+            ClassroomAnalysis.grade_level.isnot(None), is_received()
         ).group_by(ClassroomAnalysis.grade_level).order_by(
             db.func.count(ClassroomAnalysis.id).desc()
         ).limit(10).all()
         
         # Recent activity (last 7 days)
-        from datetime import datetime, timedelta
-        week_ago = datetime.utcnow() - timedelta(days=7)
+        week_ago = datetime.now(timezone.utc) - timedelta(days=7)
         recent_activity = db.session.query(
             db.func.date(ClassroomAnalysis.upload_timestamp).label('date'),
             db.func.count(ClassroomAnalysis.id).label('count')
         ).filter(
-            ClassroomAnalysis.upload_timestamp >= week_ago
+            ClassroomAnalysis.upload_timestamp >= week_ago, is_received()
         ).group_by(
             db.func.date(ClassroomAnalysis.upload_timestamp)
         ).order_by(
@@ -379,24 +947,12 @@ def get_progress_data():
         # Success rate calculation
         success_rate = (completed_analyses / total_analyses * 100) if total_analyses > 0 else 0
         
-        # Average processing time for completed analyses
-        completed_with_times = ClassroomAnalysis.query.filter(
-            ClassroomAnalysis.status == 'completed',
-            ClassroomAnalysis.analysis_timestamp.isnot(None)
-        ).all()
-        
-        processing_times = []
-        for analysis in completed_with_times:
-            if analysis.analysis_timestamp and analysis.upload_timestamp:
-                diff = analysis.analysis_timestamp - analysis.upload_timestamp
-                processing_times.append(diff.total_seconds())
-        
-        avg_processing_time = sum(processing_times) / len(processing_times) if processing_times else 0
-        
         # Most active time periods
         hour_stats = db.session.query(
             db.func.extract('hour', ClassroomAnalysis.upload_timestamp).label('hour'),
             db.func.count(ClassroomAnalysis.id).label('count')
+        ).filter(
+            is_received()
         ).group_by(
             db.func.extract('hour', ClassroomAnalysis.upload_timestamp)
         ).order_by(
@@ -404,7 +960,9 @@ def get_progress_data():
         ).limit(5).all()
         
         # Recent analyses with details
-        recent_analyses = ClassroomAnalysis.query.order_by(
+        recent_analyses = ClassroomAnalysis.query.options(
+            list_columns(*PROGRESS_RECENT_COLUMNS)
+        ).filter(is_received()).order_by(
             ClassroomAnalysis.upload_timestamp.desc()
         ).limit(10).all()
         
@@ -421,7 +979,7 @@ def get_progress_data():
                 'processing_time': analysis.analysis_timestamp.strftime('%Y-%m-%d %H:%M') if analysis.analysis_timestamp else None
             })
         
-        return jsonify({
+        payload = jsonutil.dumps({
             'total_stats': {
                 'total_analyses': total_analyses,
                 'audio_analyses': audio_analyses,
@@ -450,117 +1008,309 @@ def get_progress_data():
             },
             'recent_analyses': recent_list
         })
+        payload = payload.encode()
+        entry = (payload, gzip.compress(payload, COMPRESS_LEVEL))
+        _summary_cache.set(PROGRESS_CACHE_KEY, entry)
+        return cached_json_response(entry)
         
     except Exception as e:
         logging.error(f"Error getting progress data: {str(e)}")
         return jsonify({'error': 'Error al obtener datos de progreso'}), 500
 
+def transcribe_and_analyze_prosody(audio_path):
+    """
+    Transcribe audio_path and analyze its prosody at the same time
+    
+    Neither step needs the other's output, so the prosody analysis runs on
+    its own pool while this thread waits on Whisper.
+    Returns (transcription_result, prosody_result).
+    """
+    prosody_future = _prosody_executor.submit(audio_processor.analyze_prosody, audio_path)
+    try:
+        transcription_result = audio_processor.transcribe_audio(audio_path)
+    except BaseException:
+        prosody_future.cancel()
+        raise
+    return transcription_result, prosody_future.result()
+
+def generate_ric_feedback(combined_data):
+    """
+    RIC feedback for a transcribed session, reusing stored feedback when an
+    identical session summary was already evaluated
+    
+    Returns (feedback, cache_key); cache_key is set only for fresh feedback
+    worth storing with store_cached_feedback() once the analysis is saved.
+    """
+    cache_key = ric_agent.cache_key(combined_data)
+    cached = db.session.get(FeedbackCache, cache_key)
+    if cached is not None:
+        logging.info("Reusing stored RIC feedback for an identical session")
+        return ric_agent.with_metadata(cached.response, combined_data), None
+    
+    feedback = ric_agent.generate_educational_feedback(combined_data)
+    return feedback, (cache_key if 'error' not in feedback else None)
+
 def process_audio_analysis(analysis):
     """Process audio file and generate analysis"""
-    try:
-        analysis.status = 'processing'
-        db.session.commit()
-        
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], analysis.filename)
-        
-        # Initialize processors
-        audio_processor = AudioProcessor()
-        ric_agent = RICAgent()
-        
-        logging.info(f"Starting transcription for {analysis.filename}")
-        
-        # Step 1: Transcribe audio
-        transcription_result = audio_processor.transcribe_audio(filepath)
-        analysis.transcription_text = transcription_result['text']
-        analysis.set_transcription_data(transcription_result)
-        db.session.commit()
-        
-        logging.info(f"Starting prosodic analysis for {analysis.filename}")
-        
-        # Step 2: Analyze prosody
-        prosody_result = audio_processor.analyze_prosody(filepath)
-        analysis.set_prosody_data(prosody_result)
-        db.session.commit()
-        
-        logging.info(f"Starting RIC feedback generation for {analysis.filename}")
-        
-        # Step 3: Generate RIC feedback with educational context
-        educational_context = analysis.get_educational_context()
-        combined_data = {
-            'transcription': transcription_result,
-            'prosody': prosody_result,
-            'educational_context': educational_context
-        }
-        
-        feedback = ric_agent.generate_educational_feedback(combined_data)
-        analysis.set_ric_feedback(feedback)
-        
-        # Mark as completed
-        analysis.status = 'completed'
-        analysis.analysis_timestamp = datetime.utcnow()
-        db.session.commit()
-        
-        logging.info(f"Analysis completed for {analysis.filename}")
-        
-    except Exception as e:
-        logging.error(f"Processing error for {analysis.filename}: {str(e)}")
-        analysis.status = 'error'
-        analysis.error_message = str(e)
-        db.session.commit()
-        raise e
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], analysis.filename)
+    
+    logging.info(f"Starting transcription and prosodic analysis for {analysis.filename}")
+    
+    # Steps 1 and 2: Transcribe audio and analyze prosody, concurrently
+    transcription_result, prosody_result = transcribe_and_analyze_prosody(filepath)
+    analysis.transcription_text = transcription_result['text']
+    analysis.transcription_data = transcription_result
+    analysis.prosody_data = prosody_result
+    
+    logging.info(f"Starting RIC feedback generation for {analysis.filename}")
+    
+    # Step 3: Generate RIC feedback with educational context
+    educational_context = analysis.educational_context
+    combined_data = {
+        'transcription': transcription_result,
+        'prosody': prosody_result,
+        'educational_context': educational_context
+    }
+    
+    feedback, cache_key = generate_ric_feedback(combined_data)
+    analysis.ric_feedback = feedback
+    
+    # Mark as completed, saving every result in one commit
+    if save_completed_analysis(analysis) and cache_key is not None:
+        store_cached_feedback(cache_key, feedback)
+    
+    logging.info(f"Analysis completed for {analysis.filename}")
+
+# The full text goes to the blob store; the row only keeps a preview
+PDF_TEXT_PREVIEW_CHARS = 512
+
+
+def prepare_pdf_analysis(analysis):
+    """
+    Extract and analyze the PDF, returning the input for the lesson plan agent
+    
+    The results are only saved with the caller's final commit.
+    """
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], analysis.filename)
+    
+    logging.info(f"Starting PDF text extraction for {analysis.filename}")
+    
+    # Step 1: Extract text from PDF
+    pdf_text, page_count = pdf_processor.extract_clean_text_from_pdf(filepath)
+    analysis.pdf_text_sha256 = blob_store.put_text(pdf_text)
+    analysis.pdf_text_content = pdf_text[:PDF_TEXT_PREVIEW_CHARS]
+    
+    logging.info(f"Starting lesson plan structure analysis for {analysis.filename}")
+    
+    # Step 2: Analyze lesson plan structure
+    structure_analysis = pdf_processor.analyze_lesson_plan_structure(pdf_text, page_count)
+    analysis.lesson_plan_structure = structure_analysis
+    
+    # Step 3: Combine with the educational context for the agent
+    educational_context = analysis.educational_context
+    pdf_summary = pdf_processor.get_analysis_summary(structure_analysis)
+    
+    return {
+        'structure_analysis': structure_analysis,
+        'educational_context': educational_context,
+        'pdf_summary': pdf_summary,
+        'timestamp': datetime.now(timezone.utc).isoformat()
+    }
+
+
+def stored_pedagogical_feedback(analysis, combined_data):
+    """
+    Look up stored feedback for an identical lesson plan
+    
+    Returns (cache_key, feedback); feedback is None when the plan still has
+    to be evaluated, after which it can be kept with store_cached_feedback().
+    """
+    cache_key = lesson_plan_agent.cache_key(combined_data)
+    cached = db.session.get(FeedbackCache, cache_key)
+    if cached is None:
+        return cache_key, None
+    logging.info(f"Reusing stored pedagogical feedback for {analysis.filename}")
+    return cache_key, lesson_plan_agent.with_metadata(cached.response, combined_data)
+
 
 def process_pdf_analysis(analysis):
     """Process PDF file and generate pedagogical analysis"""
+    combined_data = prepare_pdf_analysis(analysis)
+    
+    logging.info(f"Starting pedagogical feedback generation for {analysis.filename}")
+    
+    cache_key, cached = stored_pedagogical_feedback(analysis, combined_data)
+    feedback = cached or lesson_plan_agent.generate_pedagogical_feedback(combined_data)
+    analysis.ric_feedback = feedback
+    
+    # Mark as completed, saving every result in one commit
+    if save_completed_analysis(analysis) and cached is None and 'error' not in feedback:
+        store_cached_feedback(cache_key, feedback)
+    
+    logging.info(f"PDF analysis completed for {analysis.filename}")
+
+
+@app.route('/api/analysis/<int:analysis_id>/feedback-stream')
+def stream_pdf_feedback(analysis_id):
+    """
+    Run a pending PDF analysis, streaming each evaluated criterion as Server-Sent Events
+    
+    The lesson analysis page opens this stream instead of queueing the
+    analysis, so the criteria appear as the model finishes them. A client
+    that disconnects before the end hands the analysis back to 'uploaded',
+    to be run again when its page is reopened.
+    """
+    analysis = db.get_or_404(ClassroomAnalysis, analysis_id)
+    # Claimed with the same conditional UPDATE as start_analysis(), so a
+    # second tab can't run it twice; that tab follows the status instead
+    if not analysis.is_pdf_analysis() or not claim_analysis(analysis_id):
+        return jsonify({'error': 'Analysis is not a pending PDF analysis'}), 409
+    
+    def events():
+        if not begin_analysis(analysis_id):
+            return
+        finished = False
+        try:
+            combined_data = prepare_pdf_analysis(analysis)
+            cache_key, feedback = stored_pedagogical_feedback(analysis, combined_data)
+            if feedback is None:
+                for event_name, data in lesson_plan_agent.stream_feedback_events(combined_data):
+                    if event_name == 'feedback':
+                        feedback = data
+                        break
+                    yield f"event: {event_name}\ndata: {jsonutil.dumps(data)}\n\n"
+            else:
+                cache_key = None
+            
+            analysis.ric_feedback = feedback
+            finished = True
+            if save_completed_analysis(analysis) and cache_key is not None and 'error' not in feedback:
+                store_cached_feedback(cache_key, feedback)
+            logging.info(f"PDF analysis completed for {analysis.filename}")
+            yield f"event: feedback\ndata: {jsonutil.dumps(feedback)}\n\n"
+        except Exception as e:
+            finished = True
+            logging.error(f"PDF processing error for {analysis.filename}: {str(e)}")
+            mark_analysis_failed(analysis, e)
+            yield f"event: error\ndata: {jsonutil.dumps({'error': str(e)})}\n\n"
+        finally:
+            # Closed mid-stream (GeneratorExit at a yield): drop the partial
+            # results rather than leave the row processing until it goes stale
+            if not finished:
+                db.session.rollback()
+                requeue_analyses([analysis_id])
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+def store_cached_feedback(cache_key, feedback):
+    """Persist feedback for reuse; a concurrent identical upload may have stored it first"""
+    entry = FeedbackCache()
+    entry.key = cache_key
+    entry.response = feedback
     try:
-        analysis.status = 'processing'
+        db.session.add(entry)
         db.session.commit()
-        
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], analysis.filename)
-        
-        # Initialize processors
-        pdf_processor = PDFProcessor()
-        lesson_plan_agent = LessonPlanAgent()
-        
-        logging.info(f"Starting PDF text extraction for {analysis.filename}")
-        
-        # Step 1: Extract text from PDF
-        pdf_text = pdf_processor.extract_text_from_pdf(filepath)
-        analysis.pdf_text_content = pdf_text[:10000]  # Store first 10K characters
-        db.session.commit()
-        
-        logging.info(f"Starting lesson plan structure analysis for {analysis.filename}")
-        
-        # Step 2: Analyze lesson plan structure
-        structure_analysis = pdf_processor.analyze_lesson_plan_structure(pdf_text)
-        analysis.set_lesson_plan_structure(structure_analysis)
-        db.session.commit()
-        
-        logging.info(f"Starting pedagogical feedback generation for {analysis.filename}")
-        
-        # Step 3: Generate pedagogical feedback with educational context
-        educational_context = analysis.get_educational_context()
-        pdf_summary = pdf_processor.get_analysis_summary(structure_analysis)
-        
-        combined_data = {
-            'structure_analysis': structure_analysis,
-            'educational_context': educational_context,
-            'pdf_summary': pdf_summary,
-            'timestamp': datetime.utcnow().isoformat()
-        }
-        
-        feedback = lesson_plan_agent.generate_pedagogical_feedback(combined_data)
-        analysis.set_ric_feedback(feedback)
-        
-        # Mark as completed
-        analysis.status = 'completed'
-        analysis.analysis_timestamp = datetime.utcnow()
-        db.session.commit()
-        
-        logging.info(f"PDF analysis completed for {analysis.filename}")
-        
+    except IntegrityError:
+        db.session.rollback()
+
+
+@app.route('/api/pdf-batch', methods=['POST'])
+def submit_pdf_batch():
+    """Queue uploaded PDF analyses for evaluation through the OpenAI Batch API"""
+    analysis_ids = (request.get_json(silent=True) or {}).get('analysis_ids') or []
+    analyses = ClassroomAnalysis.query.filter(
+        ClassroomAnalysis.id.in_(analysis_ids),
+        ClassroomAnalysis.analysis_type == 'pdf',
+        ClassroomAnalysis.status == 'uploaded'
+    ).all()
+    if not analyses:
+        return jsonify({'error': 'No hay análisis PDF pendientes'}), 400
+    
+    batch_requests = {}
+    request_map = {}
+    for analysis in analyses:
+        try:
+            custom_id = f"analysis-{analysis.id}"
+            # Queued until collect_pdf_batch(); the batch, not a pool worker, runs it
+            analysis.status = 'processing'
+            analysis.queued_at = db.func.now()
+            batch_requests[custom_id] = prepare_pdf_analysis(analysis)
+            request_map[custom_id] = analysis.id
+        except Exception as e:
+            logging.error(f"PDF processing error for {analysis.filename}: {str(e)}")
+            # No rollback here: it would discard the PDFs prepared before this one
+            analysis.status = 'error'
+            analysis.error_message = str(e)
+            db.session.commit()
+    
+    if not batch_requests:
+        return jsonify({'error': 'No se pudo procesar ningún PDF'}), 400
+    
+    try:
+        batch_id = batch_agent.submit_batch(batch_requests)
     except Exception as e:
-        logging.error(f"PDF processing error for {analysis.filename}: {str(e)}")
-        analysis.status = 'error'
-        analysis.error_message = str(e)
+        logging.error(f"Batch submission error: {str(e)}")
+        for analysis in analyses:
+            if analysis.id in request_map.values():
+                analysis.status = 'error'
+                analysis.error_message = str(e)
         db.session.commit()
-        raise e
+        return jsonify({'error': 'Error al enviar el lote'}), 500
+    
+    job = BatchJob()
+    job.batch_id = batch_id
+    job.request_map = request_map
+    db.session.add(job)
+    db.session.commit()
+    
+    return jsonify({'batch_id': batch_id, 'analysis_ids': list(request_map.values())}), 202
+
+
+@app.route('/api/pdf-batch/<batch_id>')
+def get_pdf_batch_status(batch_id):
+    """Check a lesson plan batch, storing its feedback once OpenAI finishes it"""
+    job = BatchJob.query.filter_by(batch_id=batch_id).first_or_404()
+    
+    if job.status == 'submitted':
+        try:
+            batch = batch_agent.retrieve_batch(batch_id)
+            if batch.status in BATCH_TERMINAL_STATUSES:
+                collect_pdf_batch(job, batch)
+        except Exception as e:
+            logging.error(f"Batch polling error for {batch_id}: {str(e)}")
+            return jsonify({'error': 'Error al consultar el lote'}), 502
+    
+    return jsonify({
+        'batch_id': job.batch_id,
+        'status': job.status,
+        'analysis_ids': list(job.request_map.values())
+    })
+
+
+def collect_pdf_batch(job, batch):
+    """Write the feedback of a finished batch into its ClassroomAnalysis rows"""
+    results = batch_agent.fetch_results(batch)
+    
+    for custom_id, analysis_id in job.request_map.items():
+        analysis = db.session.get(ClassroomAnalysis, analysis_id)
+        # Skip rows failed as stale in the meantime
+        if analysis is None or analysis.status != 'processing':
+            continue
+        feedback = results.get(custom_id)
+        if feedback is None:
+            analysis.status = 'error'
+            analysis.error_message = f"El lote terminó con estado {batch.status} sin resultado para este análisis"
+            continue
+        analysis.ric_feedback = feedback
+        analysis.status = 'completed'
+        analysis.analysis_timestamp = db.func.now()
+    
+    job.status = batch.status
+    job.completed_at = db.func.now()
+    db.session.commit()
+    logging.info(f"Lesson plan batch {job.batch_id} finished with status {batch.status}")
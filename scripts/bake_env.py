@@ -0,0 +1,37 @@
+"""Bake the variables in .env into an importable env_cache.py module.
+
+Usage: python scripts/bake_env.py [path/to/.env] [path/to/env_cache.py]
+
+Run it at build time and start the app with ENV_BAKED=1 so workers import the
+generated module (bytecode-cached by Python) instead of parsing .env on boot.
+"""
+import os
+import sys
+
+from dotenv import dotenv_values
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def bake(env_path, output_path):
+    values = dotenv_values(env_path)
+    lines = [
+        "# Generated by scripts/bake_env.py - do not edit or commit",
+        "import os",
+        "",
+    ]
+    for key, value in values.items():
+        if value is None:
+            continue
+        lines.append(f"os.environ.setdefault({key!r}, {value!r})")
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return len(values)
+
+
+if __name__ == "__main__":
+    env_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(ROOT, ".env")
+    output_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(ROOT, "env_cache.py")
+    count = bake(env_path, output_path)
+    print(f"Baked {count} variables from {env_path} into {output_path}")
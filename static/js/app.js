@@ -232,25 +232,7 @@ class RICApp {
         
         if (!analysisId || isNaN(analysisId)) return;
 
-        const pollInterval = setInterval(async () => {
-            try {
-                const response = await fetch(`/api/analysis/${analysisId}/status`);
-                const data = await response.json();
-
-                if (data.status === 'completed' || data.status === 'error') {
-                    clearInterval(pollInterval);
-                    window.location.reload();
-                }
-            } catch (error) {
-                console.error('Status polling error:', error);
-                clearInterval(pollInterval);
-            }
-        }, 5000); // Poll every 5 seconds
-
-        // Stop polling after 10 minutes to prevent infinite requests
-        setTimeout(() => {
-            clearInterval(pollInterval);
-        }, 600000);
+        watchAnalysisStatus(analysisId, () => window.location.reload());
     }
 
     setupAudioRecording() {
@@ -482,6 +464,80 @@ document.addEventListener('DOMContentLoaded', function() {
     new RICApp();
 });
 
+// Follow an analysis until it completes or fails, then call onFinished(status).
+// The server pushes status changes over Server-Sent Events; browsers without
+// EventSource fall back to polling the status endpoint.
+function watchAnalysisStatus(analysisId, onFinished) {
+    const isFinal = (data) => data.status === 'completed' || data.status === 'error';
+
+    if (!window.EventSource) {
+        const pollInterval = setInterval(async () => {
+            try {
+                const response = await fetch(`/api/analysis/${analysisId}/status`);
+                const data = await response.json();
+                if (isFinal(data)) {
+                    clearInterval(pollInterval);
+                    onFinished(data);
+                }
+            } catch (error) {
+                console.error('Status polling error:', error);
+                clearInterval(pollInterval);
+            }
+        }, 5000);
+        return;
+    }
+
+    const source = new EventSource(`/api/analysis/${analysisId}/events`);
+    source.addEventListener('status', (event) => {
+        const data = JSON.parse(event.data);
+        if (isFinal(data)) {
+            source.close();
+            onFinished(data);
+        }
+    });
+}
+
+// Run a pending lesson plan analysis over its feedback stream, adding each
+// criterion to listElement as the model finishes it, then call onFinished().
+// If the analysis is already running (e.g. in another tab), follow its status
+// instead.
+function streamLessonFeedback(analysisId, listElement, onFinished) {
+    const url = `/api/analysis/${analysisId}/feedback-stream`;
+
+    if (!window.EventSource) {
+        fetch(url).then(() => onFinished(), () => onFinished());
+        return;
+    }
+
+    const source = new EventSource(url);
+    const finish = () => {
+        source.close();
+        onFinished();
+    };
+    // A reconnect runs the analysis again from the start
+    source.addEventListener('open', () => listElement.replaceChildren());
+    source.addEventListener('criterion', (event) => {
+        const data = JSON.parse(event.data);
+        const item = document.createElement('li');
+        item.className = 'list-group-item d-flex justify-content-between align-items-center';
+        item.textContent = data.title;
+        const score = document.createElement('span');
+        score.className = 'badge bg-primary rounded-pill';
+        score.textContent = data.score;
+        item.appendChild(score);
+        listElement.appendChild(item);
+    });
+    source.addEventListener('feedback', finish);
+    source.addEventListener('error', (event) => {
+        // The server's own error event carries data; a failed connection does not
+        if (event.data) {
+            finish();
+        } else if (source.readyState === EventSource.CLOSED) {
+            watchAnalysisStatus(analysisId, onFinished);
+        }
+    });
+}
+
 // Export for potential use in other scripts
 if (typeof module !== 'undefined' && module.exports) {
     module.exports = { RICApp, RICUtils };